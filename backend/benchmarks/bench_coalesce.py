@@ -0,0 +1,75 @@
+"""Burst benchmark for read coalescing.
+
+    python benchmarks/bench_coalesce.py --burst 50 --query-ms 5
+
+Fires bursts of identical reads (the dashboard re-render pattern) against a
+simulated Mongo query and compares query count and latency with and without
+the single-flight layer.
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from coalesce import SingleFlight  # noqa: E402
+
+
+class FakeCollection:
+    """Serves one query at a time per connection slot, like a small pool."""
+
+    def __init__(self, query_ms, pool_size):
+        self.query_ms = query_ms
+        self.slots = asyncio.Semaphore(pool_size)
+        self.queries = 0
+
+    async def find(self):
+        async with self.slots:
+            self.queries += 1
+            await asyncio.sleep(self.query_ms / 1000)
+            return [{"id": str(i)} for i in range(50)]
+
+
+async def burst(n, read):
+    async def one():
+        t0 = time.perf_counter()
+        await read()
+        return time.perf_counter() - t0
+    return await asyncio.gather(*(one() for _ in range(n)))
+
+
+async def run(label, n, rounds, query_ms, pool_size, coalesce):
+    coll = FakeCollection(query_ms, pool_size)
+    flights = SingleFlight()
+
+    async def read():
+        if coalesce:
+            return await flights.do(("user", "projects"), ("projects", "user"), coll.find)
+        return await coll.find()
+
+    latencies = []
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        latencies += await burst(n, read)
+    elapsed = time.perf_counter() - t0
+    latencies.sort()
+    print(f"{label:<12} queries={coll.queries:6d}  p50={statistics.median(latencies) * 1000:7.2f}ms  "
+          f"p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:7.2f}ms  wall={elapsed:.2f}s")
+
+
+async def main(args):
+    for coalesce in (False, True):
+        await run("coalesced" if coalesce else "direct", args.burst, args.rounds,
+                  args.query_ms, args.pool_size, coalesce)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--burst", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--query-ms", type=float, default=5.0)
+    parser.add_argument("--pool-size", type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
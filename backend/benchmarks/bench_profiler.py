@@ -0,0 +1,55 @@
+"""Overhead benchmark for the event-loop profiler.
+
+    python benchmarks/bench_profiler.py --seconds 2 --interval-ms 5
+
+Runs a CPU-bound coroutine workload with no profile running, then again
+while a profiling session samples the loop, and compares throughput.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from profiling import LoopProfiler, speedscope  # noqa: E402
+
+
+async def workload(seconds):
+    """Many short tasks doing a little JSON work, like small API handlers."""
+    payload = {"messages": [{"role": "user", "content": "x" * 200}] * 20}
+    deadline = time.perf_counter() + seconds
+    done = 0
+
+    async def handler():
+        json.loads(json.dumps(payload))
+        await asyncio.sleep(0)
+
+    while time.perf_counter() < deadline:
+        await asyncio.gather(*(handler() for _ in range(50)))
+        done += 50
+    return done
+
+
+async def main(args):
+    idle = await workload(args.seconds)
+    print(f"{'idle':<10} handlers/s={idle / args.seconds:10.0f}")
+
+    profiler = LoopProfiler()
+    session = asyncio.create_task(profiler.run(args.seconds, args.interval_ms))
+    await asyncio.sleep(0)
+    profiled = await workload(args.seconds)
+    result = await session
+    profile = speedscope(result["samples"], args.interval_ms)
+    print(f"{'profiling':<10} handlers/s={profiled / args.seconds:10.0f}  "
+          f"overhead={(1 - profiled / idle) * 100:5.1f}%  samples={result['sample_count']}  "
+          f"frames={len(profile['shared']['frames'])}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--interval-ms", type=float, default=5.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,57 @@
+"""Prompt assembly cost for long chat histories.
+
+    python benchmarks/bench_prompts.py
+
+Compares the previous per-turn assembly (system prompt literal rebuilt and
+messages copied one by one) with the template registry path, for
+histories of increasing length.
+"""
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from prompts import PromptRegistry, build_messages, history_skip, HISTORY_LIMIT  # noqa: E402
+
+SYSTEM = """You are NotFox AI, a specialized assistant for Roblox game development.
+You help developers create Lua/Luau scripts, game mechanics, UI systems, and more.
+When providing code, always use proper Lua syntax highlighting.
+Be concise and helpful. Format code in markdown code blocks with 'lua' language tag."""
+
+
+def legacy(history):
+    messages = [{"role": "system", "content": "" + SYSTEM}]
+    for msg in history:
+        messages.append({"role": msg["role"], "content": msg["content"]})
+    return messages
+
+
+def timeit(fn, *args, rounds=200):
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        fn(*args)
+    return (time.perf_counter() - t0) / rounds * 1e6
+
+
+def main():
+    registry = PromptRegistry(Path("/nonexistent"))
+    t0 = time.perf_counter()
+    registry.get("roblox_game", "m")
+    print(f"registry load          {(time.perf_counter() - t0) * 1000:8.2f}ms (once, at startup)")
+    lookup = timeit(registry.get, "roblox_game", "m", rounds=100000)
+    print(f"template lookup        {lookup:8.2f}us")
+
+    for n in (50, 500, 5000):
+        history = [{"role": "user" if i % 2 == 0 else "assistant", "content": "local x = 1\n" * 40}
+                   for i in range(n)]
+        window = history[history_skip(n):][:HISTORY_LIMIT]
+        old = timeit(legacy, history)
+        new = timeit(lambda: build_messages(registry.get("roblox_game", "m"), history))
+        windowed = timeit(lambda: build_messages(registry.get("roblox_game", "m"), window))
+        print(f"{n:5d} messages  legacy {old:9.1f}us  template {new:9.1f}us  "
+              f"template+window {windowed:7.1f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Per-request overhead of the rate-limit middleware.
+
+    python benchmarks/bench_ratelimit.py --requests 200000
+    python benchmarks/bench_ratelimit.py --shared-ms 1
+
+Calls the middleware around a no-op ASGI app and subtracts the cost of
+calling the no-op app directly, for anonymous and authenticated requests
+spread over many distinct clients. The shared rows repeat that with a
+multi-worker limiter whose shared counter costs ``--shared-ms`` per
+increment: reads stay local, chat pays for its ip and user windows.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# Clients are told apart by the X-Forwarded-For the scopes carry
+os.environ.setdefault('RATE_LIMIT_PROXY_HOPS', '1')
+
+import jwt  # noqa: E402
+
+from ratelimit import RateLimiter, RateLimitMiddleware  # noqa: E402
+
+SECRET = "bench-secret"
+
+
+async def noop_app(scope, receive, send):
+    pass
+
+
+class SlowShared:
+    """Shared counter standing in for Mongo: each increment is one round trip."""
+
+    def __init__(self, latency_ms):
+        self.latency = latency_ms / 1000
+        self.round_trips = 0
+
+    async def incr(self, key, amount, expires_at):
+        self.round_trips += 1
+        await asyncio.sleep(self.latency)
+        return 1
+
+
+def scopes(n, clients, users, path="/api/projects"):
+    tokens = [b"Bearer " + jwt.encode({"user_id": f"u{i}"}, SECRET, algorithm="HS256").encode()
+              for i in range(users)]
+    for i in range(n):
+        headers = [(b"host", b"api"), (b"x-forwarded-for", f"10.0.{i % clients // 256}.{i % 256}".encode())]
+        if users:
+            headers.append((b"authorization", tokens[i % users]))
+        yield {"type": "http", "method": "GET" if path == "/api/projects" else "POST", "path": path, "headers": headers,
+               "client": ("127.0.0.1", 5000)}
+
+
+async def timed(app, batch):
+    t0 = time.perf_counter()
+    for scope in batch:
+        await app(scope, None, None)
+    return time.perf_counter() - t0
+
+
+async def main(n, clients, shared_ms):
+    # Generous limits so every request takes the full allow path
+    limits = {group: {"ip": (1e9, 1e9), "user": (1e9, 1e9)} for group in ("read", "chat")}
+    limiter = RateLimiter(limits=limits, jwt_secret=SECRET)
+    middleware = RateLimitMiddleware(noop_app, limiter)
+    for label, users in (("anonymous", 0), ("authenticated", 1000)):
+        batch = list(scopes(n, clients, users))
+        await timed(middleware, batch[:10000])  # warm token cache and buckets
+        base = await timed(noop_app, batch)
+        total = await timed(middleware, batch)
+        print(f"{label:<24} {(total - base) / n * 1e6:8.2f}us/request overhead  "
+              f"({len(limiter.buckets):,} buckets)")
+
+    # Round trips dominate here, so fewer requests are enough
+    shared_n = min(n, 2000)
+    for label, users, path in (("shared read (anonymous)", 0, "/api/projects"),
+                               ("shared read (auth)", 1000, "/api/projects"),
+                               ("shared chat (auth)", 1000, "/api/chat")):
+        shared = SlowShared(shared_ms)
+        middleware = RateLimitMiddleware(noop_app, RateLimiter(limits=limits, jwt_secret=SECRET, shared=shared))
+        batch = list(scopes(shared_n, clients, users, path))
+        await timed(middleware, batch[:1000])
+        shared.round_trips = 0
+        base = await timed(noop_app, batch)
+        total = await timed(middleware, batch)
+        print(f"{label:<24} {(total - base) / shared_n * 1e6:8.2f}us/request overhead  "
+              f"({shared.round_trips / shared_n:.1f} shared increments/request)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200_000)
+    parser.add_argument("--clients", type=int, default=10_000)
+    parser.add_argument("--shared-ms", type=float, default=1.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.clients, args.shared_ms))
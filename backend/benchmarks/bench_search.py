@@ -0,0 +1,135 @@
+"""Search benchmark at 10k and 1M messages.
+
+    python benchmarks/bench_search.py                 # in-memory index only
+    python benchmarks/bench_search.py --mongo         # also the Mongo text index
+    python benchmarks/bench_search.py --sizes 10000
+
+The Mongo run seeds a scratch database (``<DB_NAME>_bench``) from MONGO_URL
+and drops it afterwards.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from search import InvertedIndex, make_snippet, query_terms  # noqa: E402
+
+VOCAB = [
+    "local", "function", "end", "player", "humanoid", "workspace", "remoteevent", "tween",
+    "datastore", "leaderstats", "script", "module", "require", "spawn", "character", "part",
+    "touched", "connect", "health", "damage", "inventory", "gui", "frame", "button", "sound",
+    "camera", "raycast", "velocity", "anchored", "collision", "team", "round", "lobby", "shop",
+] + [f"ident{i}" for i in range(5000)]
+QUERIES = ["player health", "remoteevent connect", "datastore", "ident42 tween", "inventory gui button"]
+USER_ID = "bench-user"
+PROJECTS = 50
+
+
+def make_messages(n):
+    rng = random.Random(1)
+    for i in range(n):
+        words = rng.choices(VOCAB, k=rng.randint(10, 60))
+        yield {
+            "id": f"m{i}",
+            "project_id": f"p{i % PROJECTS}",
+            "role": "user" if i % 2 else "assistant",
+            "content": " ".join(words),
+            "created_at": f"2025-01-01T00:00:{i % 60:02d}+00:00",
+        }
+
+
+def projects():
+    return [{"id": f"p{i}", "name": f"Obby project {i}", "created_at": "2025-01-01T00:00:00+00:00"}
+            for i in range(PROJECTS)]
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1] if len(samples) >= 20 else samples[-1]
+    print(f"  {label:<22} p50={statistics.median(samples) * 1000:8.2f}ms  p95={p95 * 1000:8.2f}ms")
+
+
+def bench_memory(n, rounds):
+    index = InvertedIndex()
+    t0 = time.perf_counter()
+    index.load_user(USER_ID, projects(), make_messages(n))
+    print(f"  build                  {time.perf_counter() - t0:8.2f}s")
+
+    for query in QUERIES:
+        terms = query_terms(query)
+        samples = []
+        for _ in range(rounds):
+            t0 = time.perf_counter()
+            for doc in index.search(USER_ID, query, 0, 21):
+                make_snippet(doc["text"], terms)
+            samples.append(time.perf_counter() - t0)
+        report(repr(query), samples)
+
+
+async def bench_mongo(n, rounds):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from dotenv import load_dotenv
+
+    load_dotenv(Path(__file__).resolve().parent.parent / ".env")
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    db = client[os.environ["DB_NAME"] + "_bench"]
+    await client.drop_database(db.name)
+    try:
+        await db.projects.insert_many([dict(p, user_id=USER_ID) for p in projects()])
+        t0 = time.perf_counter()
+        batch = []
+        for msg in make_messages(n):
+            batch.append(msg)
+            if len(batch) == 10000:
+                await db.messages.insert_many(batch)
+                batch = []
+        if batch:
+            await db.messages.insert_many(batch)
+        await db.messages.create_index([("content", "text")], default_language="none")
+        await db.messages.create_index([("project_id", 1), ("created_at", 1)])
+        print(f"  seed + index           {time.perf_counter() - t0:8.2f}s")
+
+        project_ids = [p["id"] for p in projects()]
+        for query in QUERIES:
+            terms = query_terms(query)
+            samples = []
+            for _ in range(rounds):
+                t0 = time.perf_counter()
+                docs = await db.messages.aggregate([
+                    {"$match": {"$text": {"$search": query}, "project_id": {"$in": project_ids}}},
+                    {"$sort": {"score": {"$meta": "textScore"}}},
+                    {"$limit": 21},
+                    {"$project": {"_id": 0, "content": 1, "score": {"$meta": "textScore"}}},
+                ]).to_list(21)
+                for doc in docs:
+                    make_snippet(doc["content"], terms)
+                samples.append(time.perf_counter() - t0)
+            report(repr(query), samples)
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 1_000_000])
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--mongo", action="store_true")
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        print(f"in-memory index, {n:,} messages")
+        bench_memory(n, args.rounds)
+        if args.mongo:
+            print(f"mongo text index, {n:,} messages")
+            asyncio.run(bench_mongo(n, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Startup time and first-request latency.
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --path /api/projects --token <jwt>
+
+Starts uvicorn and reports time until liveness answers, time until readiness
+turns 200 (warm-up finished and Mongo reachable), and the latency of the
+first and following requests to ``--path``. Requires MONGO_URL to reach a
+running Mongo for readiness to succeed.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def poll(client, url, ok, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            response = client.get(url)
+            if ok(response):
+                return response
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.01)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", default="/api/subscription/plans")
+    parser.add_argument("--token", default=os.environ.get("BENCH_TOKEN"))
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    port = free_port()
+    base = f"http://127.0.0.1:{port}/api"
+    t0 = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+    )
+    try:
+        with httpx.Client(timeout=10) as client:
+            if poll(client, base + "/health/live", lambda r: r.status_code == 200, args.timeout) is None:
+                sys.exit("server never became live")
+            live = time.perf_counter() - t0
+            ready_response = poll(client, base + "/health/ready", lambda r: r.status_code == 200, args.timeout)
+            ready = time.perf_counter() - t0
+            print(f"live after      {live * 1000:8.1f}ms")
+            if ready_response is None:
+                print(f"not ready after {args.timeout:.0f}s")
+            else:
+                checks = ready_response.json()["checks"]
+                print(f"ready after     {ready * 1000:8.1f}ms")
+                for name, step in checks["warmup"]["steps"].items():
+                    print(f"  warm-up {name:<13} {step['ms']:8.1f}ms  ok={step['ok']}")
+
+        # Fresh client so the first request also pays for its own connection,
+        # like a real browser hitting a just-started instance
+        headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+        with httpx.Client(timeout=30, headers=headers) as client:
+            samples = []
+            for _ in range(args.requests):
+                t1 = time.perf_counter()
+                client.get(base + args.path.removeprefix("/api"))
+                samples.append(time.perf_counter() - t1)
+        print(f"first request   {samples[0] * 1000:8.2f}ms")
+        print(f"later p50       {statistics.median(samples[1:]) * 1000:8.2f}ms")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
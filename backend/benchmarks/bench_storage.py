@@ -0,0 +1,77 @@
+"""Storage saved and read-path CPU cost of the compact message format.
+
+    python benchmarks/bench_storage.py --messages 20000
+
+Encodes a synthetic chat history (short prompts, long Luau answers) in each
+format and times BSON decode plus ``decode_message``, which is what every
+read path pays per message.
+"""
+import argparse
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import bson  # noqa: E402
+
+from storage import decode_message, encode_message, zstandard  # noqa: E402
+
+LUAU = """local Players = game:GetService("Players")
+local DataStoreService = game:GetService("DataStoreService")
+local store = DataStoreService:GetDataStore("PlayerData")
+
+Players.PlayerAdded:Connect(function(player)
+    local leaderstats = Instance.new("Folder")
+    leaderstats.Name = "leaderstats"
+    leaderstats.Parent = player
+    local ok, data = pcall(function() return store:GetAsync(player.UserId) end)
+end)
+"""
+
+
+def history(n):
+    rng = random.Random(1)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    for i in range(n):
+        if i % 2 == 0:
+            content = "How do I save coins for player %d?" % i
+        else:
+            content = "Here is a script:\n```lua\n" + LUAU * rng.randint(1, 12) + "```"
+        yield {
+            "id": str(uuid.uuid4()),
+            "project_id": "6b8d1c44-9d0e-4a55-9a51-3f2f1f4a0c11",
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": content,
+            "created_at": (start + timedelta(seconds=i)).isoformat(),
+        }
+
+
+def run(label, docs, storage_format, codec):
+    encoded = [bson.encode(encode_message(d, storage_format, codec=codec)) for d in docs]
+    size = sum(map(len, encoded))
+    t0 = time.perf_counter()
+    for raw in encoded:
+        decode_message(bson.decode(raw))
+    per_msg = (time.perf_counter() - t0) / len(encoded) * 1e6
+    return label, size, per_msg
+
+
+def main(n):
+    docs = list(history(n))
+    rows = [run("legacy", docs, "legacy", None), run("compact+zlib", docs, "compact", "zlib")]
+    if zstandard:
+        rows.append(run("compact+zstd", docs, "compact", "zstd"))
+    base = rows[0][1]
+    for label, size, per_msg in rows:
+        print(f"{label:<14} {size / 1e6:8.2f}MB  {(1 - size / base) * 100:5.1f}% saved  "
+              f"read {per_msg:6.2f}us/message")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=20_000)
+    main(parser.parse_args().messages)
@@ -0,0 +1,81 @@
+"""NDJSON export/import throughput in MB/s.
+
+    python benchmarks/bench_transfer.py --messages 100000
+
+Runs the same serializer and line parser the endpoints use over an in-memory
+cursor, so the numbers are the app's own cost excluding Mongo and network.
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from transfer import export_lines, iter_lines, parse_record, validate_message, validate_project  # noqa: E402
+
+PROJECT = {"id": "p1", "name": "Bench", "project_type": "roblox_game",
+           "created_at": "2025-01-01T00:00:00+00:00", "updated_at": "2025-01-01T00:00:00+00:00"}
+
+
+async def cursor(n, body_size):
+    rng = random.Random(1)
+    body = "local part = Instance.new('Part') -- " * (body_size // 38 + 1)
+    for i in range(n):
+        yield {"id": f"m{i}", "project_id": "p1", "role": "user" if i % 2 else "assistant",
+               "content": body[:rng.randint(body_size // 2, body_size)],
+               "created_at": f"2025-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}+00:00"}
+
+
+async def export(n, body_size):
+    total = 0
+    async for chunk in export_lines(PROJECT, cursor(n, body_size)):
+        total += len(chunk)
+    return total
+
+
+async def archive_chunks(data, chunk_size):
+    for i in range(0, len(data), chunk_size):
+        yield data[i:i + chunk_size]
+
+
+async def parse(data):
+    count = 0
+    async for line_no, line in iter_lines(archive_chunks(data, 64 * 1024)):
+        record = parse_record(line_no, line)
+        if line_no == 1:
+            validate_project(line_no, record)
+        else:
+            validate_message(line_no, record)
+            count += 1
+    return count
+
+
+async def main(n, body_size):
+    t0 = time.perf_counter()
+    size = await export(n, body_size)
+    elapsed = time.perf_counter() - t0
+    # Separate pass: tracemalloc slows allocation-heavy code several times over
+    tracemalloc.start()
+    await export(n, body_size)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"export  {n:,} messages  {size / 1e6:8.1f}MB  {size / 1e6 / elapsed:8.1f}MB/s  "
+          f"peak {peak / 1e6:.1f}MB")
+
+    data = b"".join([chunk async for chunk in export_lines(PROJECT, cursor(n, body_size))])
+    t0 = time.perf_counter()
+    count = await parse(data)
+    elapsed = time.perf_counter() - t0
+    print(f"import  {count:,} messages  {len(data) / 1e6:8.1f}MB  {len(data) / 1e6 / elapsed:8.1f}MB/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--body-size", type=int, default=1500)
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.body_size))
@@ -0,0 +1,111 @@
+"""Throughput scaling from 1 to N uvicorn workers on one machine.
+
+    python benchmarks/bench_workers.py --workers 1 2 4
+    python benchmarks/bench_workers.py --path /api/projects --token <jwt>
+
+Starts ``uvicorn server:app --workers N`` for each N, drives it from several
+load-generator processes and reports requests/second and the speedup over
+one worker. Pass SHARED_STATE_BACKEND=mongo (the default) to include the
+cross-worker invalidation poller in the measurement; it needs MONGO_URL.
+Scaling is bounded by the number of CPU cores left over for the load
+generators.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url, timeout=90):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"server at {url} did not start")
+
+
+def load(url, headers, concurrency, duration, results):
+    async def worker(client, deadline, counts):
+        while time.monotonic() < deadline:
+            response = await client.get(url, headers=headers)
+            counts[0 if response.status_code < 400 else 1] += 1
+
+    async def main():
+        counts = [0, 0]
+        limits = httpx.Limits(max_connections=concurrency)
+        async with httpx.AsyncClient(limits=limits, timeout=10) as client:
+            deadline = time.monotonic() + duration
+            await asyncio.gather(*(worker(client, deadline, counts) for _ in range(concurrency)))
+        results.put(counts)
+
+    asyncio.run(main())
+
+
+def run(workers, args):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+    )
+    try:
+        base = f"http://127.0.0.1:{port}"
+        wait_until_up(base + "/api/")
+        headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+        results = multiprocessing.Queue()
+        procs = [
+            multiprocessing.Process(target=load, args=(base + args.path, headers, args.concurrency,
+                                                       args.duration, results))
+            for _ in range(args.clients)
+        ]
+        for proc in procs:
+            proc.start()
+        counts = [results.get() for _ in procs]
+        for proc in procs:
+            proc.join()
+        ok = sum(c[0] for c in counts)
+        errors = sum(c[1] for c in counts)
+        return ok / args.duration, errors
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--path", default="/api/subscription/plans")
+    parser.add_argument("--token", default=os.environ.get("BENCH_TOKEN"))
+    parser.add_argument("--clients", type=int, default=max(2, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    baseline = None
+    for workers in args.workers:
+        rps, errors = run(workers, args)
+        baseline = baseline or rps
+        print(f"workers={workers:<3} {rps:9.0f} req/s  speedup {rps / baseline:4.2f}x  errors={errors}")
+
+
+if __name__ == "__main__":
+    main()
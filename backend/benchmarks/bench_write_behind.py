@@ -0,0 +1,99 @@
+"""Write-path benchmark for the chat write-behind buffer.
+
+    python benchmarks/bench_write_behind.py --turns 500 --concurrency 50 --write-ms 2
+
+Simulates concurrent chat turns (two message inserts plus six rollup upserts
+each) against a pool-limited fake Mongo and compares round trips and per-turn
+write latency writing through versus through the write-behind buffer.
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from usage import rollup_increments  # noqa: E402
+from write_behind import WriteBehindBuffer  # noqa: E402
+
+
+class FakeCollection:
+    """Each call costs one round trip on a small connection pool."""
+
+    def __init__(self, db):
+        self.db = db
+
+    async def _round_trip(self):
+        async with self.db.slots:
+            self.db.round_trips += 1
+            await asyncio.sleep(self.db.write_ms / 1000)
+
+    async def insert_one(self, doc):
+        await self._round_trip()
+
+    async def insert_many(self, docs, ordered=True):
+        await self._round_trip()
+
+    async def bulk_write(self, requests, ordered=True):
+        await self._round_trip()
+
+
+class FakeDatabase:
+    def __init__(self, write_ms, pool_size):
+        self.write_ms = write_ms
+        self.slots = asyncio.Semaphore(pool_size)
+        self.round_trips = 0
+
+    def __getattr__(self, name):
+        return FakeCollection(self)
+
+    def __getitem__(self, name):
+        return FakeCollection(self)
+
+
+async def run(label, args, enabled):
+    db = FakeDatabase(args.write_ms, args.pool_size)
+    buffer = WriteBehindBuffer(lambda: db, enabled=enabled, interval=args.flush_ms / 1000)
+    buffer.start()
+    usage = {"prompt_tokens": 120, "completion_tokens": 30, "total_tokens": 150, "cost": 0.0004}
+    gate = asyncio.Semaphore(args.concurrency)
+
+    async def turn(i):
+        async with gate:
+            t0 = time.perf_counter()
+            project_id = f"p{i % 20}"
+            for role in ("user", "assistant"):
+                doc = {"id": f"{i}-{role}", "project_id": project_id, "role": role, "content": "x"}
+                await buffer.insert_message(doc, doc)
+            increments = rollup_increments(f"u{i % 20}", project_id, "model", usage, 100.0,
+                                           datetime.now(timezone.utc))
+            if enabled:
+                buffer.increment("usage_rollups", increments)
+            else:
+                await db.usage_rollups.bulk_write([], ordered=False)
+            return time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    latencies = sorted(await asyncio.gather(*(turn(i) for i in range(args.turns))))
+    await buffer.stop()
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<14} round_trips={db.round_trips:6d}  p50={statistics.median(latencies) * 1000:7.2f}ms  "
+          f"p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:7.2f}ms  wall={elapsed:.2f}s")
+
+
+async def main(args):
+    await run("write-through", args, False)
+    await run("write-behind", args, True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--write-ms", type=float, default=2.0)
+    parser.add_argument("--pool-size", type=int, default=10)
+    parser.add_argument("--flush-ms", type=float, default=50.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,50 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Set
+
+
+class SingleFlight:
+    """Share one in-flight read among concurrent identical requests.
+
+    Each call names a ``key`` (who is asking for what) and the ``resource``
+    the result depends on. Concurrent calls with the same key await the same
+    task. ``invalidate(resource)`` detaches every flight for that resource, so
+    requests arriving after a write always start a fresh read while requests
+    already waiting keep the result they were promised.
+
+    The query runs in its own task, so a disconnecting client cannot cancel
+    it for the others. Shared results must be treated as read-only.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, asyncio.Task] = {}
+        self._by_resource: Dict[Hashable, Set[Hashable]] = {}
+        self.started = 0
+        self.joined = 0
+
+    async def do(self, key: Hashable, resource: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._flights.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._flights[key] = task
+            self._by_resource.setdefault(resource, set()).add(key)
+            task.add_done_callback(lambda t: self._finish(key, resource, t))
+            self.started += 1
+        else:
+            self.joined += 1
+        return await asyncio.shield(task)
+
+    def invalidate(self, resource: Hashable):
+        for key in self._by_resource.pop(resource, ()):
+            self._flights.pop(key, None)
+
+    def _finish(self, key: Hashable, resource: Hashable, task: asyncio.Task):
+        if not task.cancelled():
+            # Mark the exception retrieved; every waiter re-raises it anyway
+            task.exception()
+        if self._flights.get(key) is task:
+            del self._flights[key]
+            keys = self._by_resource.get(resource)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_resource[resource]
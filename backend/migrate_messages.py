@@ -0,0 +1,98 @@
+"""Rewrite stored messages into another storage format.
+
+    python migrate_messages.py --to compact
+    python migrate_messages.py --to legacy --batch-size 500
+    python migrate_messages.py --to compact --dry-run
+
+Only documents not already in the target format are touched, so the tool
+can be interrupted and re-run. The server reads both formats throughout.
+"""
+import argparse
+import os
+import time
+from pathlib import Path
+
+import bson
+from dotenv import load_dotenv
+from pymongo import MongoClient, ReplaceOne
+
+from storage import STORAGE_FORMATS, encode_message
+
+load_dotenv(Path(__file__).parent / '.env')
+
+PENDING_FILTERS = {
+    "compact": {"$or": [
+        {"id": {"$type": "string"}},
+        {"created_at": {"$type": "string"}},
+        # Compressed before search_text existed
+        {"content_z": {"$exists": True}, "search_text": {"$exists": False}},
+        # Written before created_us existed
+        {"created_us": {"$exists": False}}
+    ]},
+    "legacy": {"$or": [
+        {"id": {"$type": "binData"}},
+        {"created_at": {"$type": "date"}},
+        {"content_z": {"$exists": True}},
+        {"created_us": {"$exists": False}}
+    ]},
+}
+
+
+def collection_size(db):
+    stats = db.command("collStats", "messages")
+    return stats.get("size", 0), stats.get("storageSize", 0), stats.get("totalIndexSize", 0)
+
+
+def migrate(db, target: str, batch_size: int, dry_run: bool):
+    before_bytes = after_bytes = migrated = 0
+    batch = []
+    started = time.perf_counter()
+
+    def flush():
+        if batch and not dry_run:
+            db.messages.bulk_write(batch, ordered=False)
+        batch.clear()
+
+    for doc in db.messages.find(PENDING_FILTERS[target]).batch_size(batch_size):
+        new_doc = encode_message(doc, target)
+        new_doc["_id"] = doc["_id"]
+        before_bytes += len(bson.encode(doc))
+        after_bytes += len(bson.encode(new_doc))
+        batch.append(ReplaceOne({"_id": doc["_id"]}, new_doc))
+        migrated += 1
+        if len(batch) >= batch_size:
+            flush()
+            print(f"  {migrated:,} messages rewritten")
+    flush()
+
+    elapsed = time.perf_counter() - started
+    saved = before_bytes - after_bytes
+    pct = saved / before_bytes * 100 if before_bytes else 0.0
+    verb = "would rewrite" if dry_run else "rewrote"
+    print(f"{verb} {migrated:,} messages in {elapsed:.1f}s")
+    print(f"document bytes {before_bytes:,} -> {after_bytes:,} ({saved:,} saved, {pct:.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--to", choices=STORAGE_FORMATS, required=True)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    client = MongoClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        size, storage, indexes = collection_size(db)
+        migrate(db, args.to, args.batch_size, args.dry_run)
+        if not args.dry_run:
+            new_size, new_storage, new_indexes = collection_size(db)
+            print(f"collection data {size:,} -> {new_size:,} bytes")
+            print(f"storage on disk {storage:,} -> {new_storage:,} bytes (reclaimed after compaction)")
+            print(f"index size      {indexes:,} -> {new_indexes:,} bytes")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+# On-demand sampling of the event-loop thread. Nothing runs between
+# sessions: the sampler thread and the loop heartbeat exist only while a
+# profile is being taken, so leaving the endpoint enabled costs nothing.
+DEFAULT_INTERVAL_MS = 5.0
+HEARTBEAT_MS = 10.0
+BLOCK_THRESHOLD_MS = float(os.environ.get('PROFILE_BLOCK_THRESHOLD_MS', '100'))
+MAX_SECONDS = 60.0
+MAX_BLOCKS = 20
+MAX_DEPTH = 128
+FORMATS = ("speedscope", "collapsed")
+
+_path_prefixes = sorted({os.path.join(p, "") for p in sys.path if p}, key=len, reverse=True)
+_labels: Dict[Any, Tuple[str, str, int]] = {}
+
+
+def _label(code) -> Tuple[str, str, int]:
+    """(name, file, line) for a code object, with the sys.path prefix stripped."""
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        for prefix in _path_prefixes:
+            if filename.startswith(prefix):
+                filename = filename[len(prefix):]
+                break
+        label = _labels[code] = (getattr(code, "co_qualname", code.co_name), filename, code.co_firstlineno)
+    return label
+
+
+def _stack(frame) -> Tuple[Tuple[str, str, int], ...]:
+    """Root-first stack of ``frame``."""
+    stack = []
+    while frame is not None and len(stack) < MAX_DEPTH:
+        stack.append(_label(frame.f_code))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+def _frame_name(frame: Tuple[str, str, int]) -> str:
+    return f"{frame[0]} ({frame[1]}:{frame[2]})"
+
+
+class ProfileBusy(Exception):
+    pass
+
+
+class LoopProfiler:
+    """Samples the event-loop thread's stack from a helper thread.
+
+    A heartbeat callback on the loop stamps the time every
+    ``HEARTBEAT_MS``. When the sampler sees the stamp go stale by more than
+    ``block_threshold_ms`` a callback is holding the loop, and the stacks
+    sampled until the heartbeat returns are attributed to that block.
+    """
+
+    def __init__(self, block_threshold_ms: float = BLOCK_THRESHOLD_MS):
+        self.block_threshold_ms = block_threshold_ms
+        self._lock = asyncio.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    async def run(self, seconds: float, interval_ms: float = DEFAULT_INTERVAL_MS) -> Dict[str, Any]:
+        if self._lock.locked():
+            raise ProfileBusy()
+        async with self._lock:
+            return await _Session(asyncio.get_running_loop(), interval_ms, self.block_threshold_ms).run(seconds)
+
+
+class _Session:
+    def __init__(self, loop, interval_ms: float, block_threshold_ms: float):
+        self.loop = loop
+        self.interval = interval_ms / 1000
+        self.block_threshold = block_threshold_ms / 1000
+        self.loop_thread = threading.get_ident()
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self.lags: List[float] = []
+        self.blocks: List[Dict[str, Any]] = []
+        self._beat = time.monotonic()
+        self._heartbeat: Optional[asyncio.TimerHandle] = None
+        self._stop = threading.Event()
+
+    def _tick(self, scheduled: float):
+        now = time.monotonic()
+        self.lags.append(now - scheduled)
+        self._beat = now
+        self._heartbeat = self.loop.call_at(now + HEARTBEAT_MS / 1000, self._tick, now + HEARTBEAT_MS / 1000)
+
+    def _sample(self):
+        block = None
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.loop_thread)
+            if frame is None:
+                continue
+            stack = _stack(frame)
+            del frame
+            self.samples[stack] += 1
+            self.sample_count += 1
+
+            beat = self._beat
+            if time.monotonic() - beat > self.block_threshold:
+                if block is None or block["beat"] != beat:
+                    block = {"beat": beat, "stacks": Counter()}
+                block["stacks"][stack] += 1
+            elif block is not None:
+                self._close_block(block, beat)
+                block = None
+        if block is not None:
+            self._close_block(block, time.monotonic())
+
+    def _close_block(self, block, resumed: float):
+        self.blocks.append({
+            "duration_ms": round((resumed - block["beat"]) * 1000, 1),
+            "stack": [_frame_name(f) for f in block["stacks"].most_common(1)[0][0]],
+        })
+
+    async def run(self, seconds: float) -> Dict[str, Any]:
+        started = time.monotonic()
+        self._tick(started)
+        thread = threading.Thread(target=self._sample, name="loop-profiler", daemon=True)
+        thread.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self._stop.set()
+            self._heartbeat.cancel()
+            await asyncio.to_thread(thread.join)
+        return self.result(time.monotonic() - started)
+
+    def result(self, elapsed: float) -> Dict[str, Any]:
+        lags = sorted(self.lags)
+        blocks = sorted(self.blocks, key=lambda b: b["duration_ms"], reverse=True)[:MAX_BLOCKS]
+        return {
+            "seconds": round(elapsed, 3),
+            "interval_ms": self.interval * 1000,
+            "sample_count": self.sample_count,
+            "samples": self.samples,
+            "loop_lag": {
+                "heartbeat_ms": HEARTBEAT_MS,
+                "max_ms": round(lags[-1] * 1000, 1) if lags else 0.0,
+                "p99_ms": round(lags[int(len(lags) * 0.99)] * 1000, 1) if lags else 0.0,
+                "mean_ms": round(sum(lags) / len(lags) * 1000, 2) if lags else 0.0,
+                "block_threshold_ms": self.block_threshold * 1000,
+                "blocked": blocks,
+            },
+        }
+
+
+def collapsed(samples: Counter) -> str:
+    """Brendan Gregg's folded format, one ``root;...;leaf count`` line per stack."""
+    lines = [
+        ";".join(_frame_name(f) for f in stack) + f" {count}"
+        for stack, count in samples.most_common()
+    ]
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def speedscope(samples: Counter, interval_ms: float, name: str = "event loop") -> Dict[str, Any]:
+    """A sampled profile in speedscope's file format, weighted in milliseconds."""
+    frames: List[Dict[str, Any]] = []
+    index: Dict[Tuple[str, str, int], int] = {}
+    stacks, weights = [], []
+    for stack, count in samples.most_common():
+        ids = []
+        for frame in stack:
+            i = index.get(frame)
+            if i is None:
+                i = index[frame] = len(frames)
+                frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+            ids.append(i)
+        stacks.append(ids)
+        weights.append(count * interval_ms)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "exporter": "notfox-profiler",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": stacks,
+            "weights": weights,
+        }],
+    }
@@ -0,0 +1,187 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import tiktoken
+except ImportError:  # token counts fall back to an estimate
+    tiktoken = None
+
+# Built-in system prompts keyed by (project_type, model); "*" matches any.
+# Lookup order: exact, project type for any model, model for any project
+# type, then the global default.
+DEFAULT_TEMPLATES: Dict[Tuple[str, str], str] = {
+    ("*", "*"): """You are NotFox AI, a specialized assistant for Roblox game development.
+You help developers create Lua/Luau scripts, game mechanics, UI systems, and more.
+When providing code, always use proper Lua syntax highlighting.
+Be concise and helpful. Format code in markdown code blocks with 'lua' language tag.""",
+}
+
+# Optional JSON file of overrides, re-read when it changes:
+#   {"templates": [{"project_type": "roblox_game", "model": "*", "system": "..."}]}
+PROMPT_TEMPLATES_PATH = Path(os.environ.get(
+    'PROMPT_TEMPLATES_PATH', str(Path(__file__).parent / 'prompt_templates.json')
+))
+RELOAD_CHECK_SECONDS = 2.0
+
+# The history window only ever starts at a multiple of HISTORY_STEP, so the
+# prompt prefix (system prompt + oldest messages) stays byte-identical for
+# many turns and providers with prefix caching can reuse it.
+HISTORY_LIMIT = 50
+HISTORY_STEP = 10
+MAX_PROMPT_TOKENS = int(os.environ.get('MAX_PROMPT_TOKENS', '24000'))
+
+_encoding = None
+_encoding_loaded = False
+
+
+def count_tokens(text: str) -> int:
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        if tiktoken is not None:
+            try:
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                # The encoding is downloaded on first use; offline hosts estimate instead
+                logging.warning(f"tiktoken unavailable, estimating token counts: {e}")
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return estimate_tokens(text)
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / 4)
+
+
+class PromptTemplate:
+    __slots__ = ("project_type", "model", "system", "system_message", "token_count")
+
+    def __init__(self, project_type: str, model: str, system: str, token_count: Optional[int] = None):
+        self.project_type = project_type
+        self.model = model
+        self.system = system
+        # Built once and shared by every request using this template
+        self.system_message = {"role": "system", "content": system}
+        self.token_count = count_tokens(system) if token_count is None else token_count
+
+
+class PromptRegistry:
+    """System prompt templates, loaded and hot-reloaded off the event loop.
+
+    ``reload`` and ``check`` read the file and count tokens (which may fetch
+    the tiktoken encoding), so they only ever run in a worker thread: once
+    during startup warm-up and then from the ``start`` watcher. Until the
+    first load finishes ``get`` serves the built-in defaults with estimated
+    token counts rather than making a chat wait.
+    """
+
+    def __init__(self, path: Path = PROMPT_TEMPLATES_PATH):
+        self.path = path
+        self.defaults: Dict[Tuple[str, str], PromptTemplate] = {
+            key: PromptTemplate(key[0], key[1], system, estimate_tokens(system))
+            for key, system in DEFAULT_TEMPLATES.items()
+        }
+        self.templates: Dict[Tuple[str, str], PromptTemplate] = {}
+        self._mtime: Optional[float] = None
+        self._lock = threading.Lock()
+        self._watcher: Optional[asyncio.Task] = None
+
+    def reload(self):
+        with self._lock:
+            self._reload()
+
+    def _reload(self):
+        templates = {key: PromptTemplate(key[0], key[1], system) for key, system in DEFAULT_TEMPLATES.items()}
+        mtime = None
+        try:
+            mtime = self.path.stat().st_mtime
+            overrides = {}
+            for item in json.loads(self.path.read_text())["templates"]:
+                key = (item.get("project_type", "*"), item.get("model", "*"))
+                overrides[key] = PromptTemplate(key[0], key[1], item["system"])
+            templates.update(overrides)
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError) as e:
+            # Keep serving the previous templates rather than half-applied ones
+            logging.error(f"Invalid prompt templates in {self.path}: {e}")
+            if self.templates:
+                self._mtime = mtime
+                return
+        self.templates = templates
+        self._mtime = mtime
+
+    def check(self):
+        """Reload if the file changed since the last load."""
+        try:
+            mtime = self.path.stat().st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._mtime or not self.templates:
+            self.reload()
+            logging.info(f"Reloaded prompt templates from {self.path}")
+
+    async def start(self):
+        if self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch_forever())
+
+    async def stop(self):
+        if self._watcher:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+
+    async def _watch_forever(self):
+        while True:
+            await asyncio.sleep(RELOAD_CHECK_SECONDS)
+            try:
+                await asyncio.to_thread(self.check)
+            except Exception as e:
+                logging.warning(f"Prompt template reload failed: {e}")
+
+    def get(self, project_type: str, model: str) -> PromptTemplate:
+        templates = self.templates or self.defaults
+        for key in ((project_type, model), (project_type, "*"), ("*", model), ("*", "*")):
+            template = templates.get(key)
+            if template is not None:
+                return template
+        raise LookupError("No default prompt template")
+
+
+def history_skip(total: int, limit: int = HISTORY_LIMIT, step: int = HISTORY_STEP) -> int:
+    """How many of the oldest ``total`` messages to leave out of the prompt."""
+    if total <= limit:
+        return 0
+    return math.ceil((total - limit) / step) * step
+
+
+def build_messages(template: PromptTemplate, history: List[dict],
+                   max_tokens: int = MAX_PROMPT_TOKENS, step: int = HISTORY_STEP) -> List[dict]:
+    """System prompt followed by ``history`` in order, trimmed to ``max_tokens``.
+
+    Trimming drops whole ``step``-sized blocks from the front so the prefix
+    stays aligned with ``history_skip``.
+    """
+    turns = [{"role": m["role"], "content": m["content"]} for m in history]
+    # History is budgeted at ~4 characters per token; exact counts per turn
+    # would cost more than the whole assembly
+    budget = (max_tokens - template.token_count) * 4
+    total = sum(len(t["content"]) for t in turns)
+    start = 0
+    while total > budget and len(turns) - start > 1:
+        drop = min(step, len(turns) - start - 1)
+        total -= sum(len(t["content"]) for t in turns[start:start + drop])
+        start += drop
+    if start:
+        del turns[:start]
+    turns.insert(0, template.system_message)
+    return turns
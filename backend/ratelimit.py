@@ -0,0 +1,267 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+import jwt
+
+# Token-bucket limits per route group: (burst capacity, refill tokens/second).
+# "ip" buckets apply to every request, "user" buckets to authenticated ones.
+# Override any of them with RATE_LIMITS, e.g.
+#   RATE_LIMITS='{"chat": {"user": [5, 0.1]}, "auth": {"ip": [20, 0.5]}}'
+DEFAULT_LIMITS: Dict[str, Dict[str, Tuple[float, float]]] = {
+    "auth": {"ip": (10, 10 / 60)},
+    "chat": {"ip": (60, 1.0), "user": (20, 0.5)},
+    "payments": {"ip": (20, 20 / 60), "user": (10, 10 / 60)},
+    "read": {"ip": (300, 10.0), "user": (120, 5.0)},
+    "write": {"ip": (120, 2.0), "user": (60, 1.0)},
+}
+
+# Idle buckets are evicted after this long; a bucket idle that long has
+# refilled completely anyway, so dropping it changes nothing.
+IDLE_SECONDS = 600
+SWEEP_INTERVAL_SECONDS = 60
+TOKEN_CACHE_SIZE = 10000
+ROUTE_CACHE_SIZE = 4096
+
+# Number of trusted reverse proxies in front of the app. Behind N proxies the
+# client address is taken N positions from the right of X-Forwarded-For, so
+# clients cannot spoof it by sending their own. 0 uses the socket peer and
+# ignores the header. There is deliberately no default: behind a proxy the
+# socket peer is the proxy, and every client would share one bucket. Until
+# it is set the socket peer is used and the first forwarded request logs an
+# error. The preview deployment sits behind one ingress (backend/.env).
+PROXY_HOPS: Optional[int] = (
+    int(os.environ['RATE_LIMIT_PROXY_HOPS']) if os.environ.get('RATE_LIMIT_PROXY_HOPS') else None
+)
+_proxy_hops_reported = False
+
+# With several workers the per-process buckets only see part of the traffic,
+# so these groups are also counted in a shared window (one shared-state
+# increment per scope and request, issued together). Cheap routes stay off
+# the shared counter and are limited per worker; "*" shares every group.
+SHARED_GROUPS = os.environ.get('RATE_LIMIT_SHARED_GROUPS', 'auth,chat,payments')
+
+
+def load_limits() -> Dict[str, Dict[str, Tuple[float, float]]]:
+    limits = {group: dict(scopes) for group, scopes in DEFAULT_LIMITS.items()}
+    for group, scopes in json.loads(os.environ.get('RATE_LIMITS', '{}')).items():
+        for scope, (capacity, rate) in scopes.items():
+            limits.setdefault(group, {})[scope] = (float(capacity), float(rate))
+    return limits
+
+
+_route_cache: Dict[Tuple[str, str], Optional[str]] = {}
+
+
+def route_group(method: str, path: str) -> Optional[str]:
+    key = (method, path)
+    try:
+        return _route_cache[key]
+    except KeyError:
+        pass
+    if len(_route_cache) >= ROUTE_CACHE_SIZE:
+        _route_cache.clear()
+    group = _route_cache[key] = _classify(method, path)
+    return group
+
+
+def _classify(method: str, path: str) -> Optional[str]:
+    if not path.startswith("/api/") or method == "OPTIONS":
+        return None
+    if path.startswith("/api/health") or path.startswith("/api/webhook/"):
+        return None
+    if path in ("/api/auth/login", "/api/auth/register"):
+        return "auth"
+    if path == "/api/chat":
+        return "chat"
+    if path.startswith("/api/payments/"):
+        return "payments"
+    if method in ("GET", "HEAD"):
+        return "read"
+    return "write"
+
+
+class RateLimiter:
+    """Token buckets keyed by (group, scope, identity).
+
+    Each bucket is a two-item list ``[tokens, updated_at]`` refilled lazily
+    on access, so memory is constant per key and nothing runs in the
+    background. Once per ``SWEEP_INTERVAL_SECONDS`` the request that notices
+    drops buckets idle for ``IDLE_SECONDS``; amortized over the interval
+    that costs far less than keeping buckets in LRU order on every request.
+
+    Given ``shared`` (a multi-worker ``SharedState``), requests the local
+    bucket lets through are also counted against a fixed window shared by
+    every worker: ``capacity`` requests per ``capacity / rate`` seconds.
+    The local bucket still rejects floods without touching the backend.
+    """
+
+    def __init__(self, limits=None, jwt_secret: str = "", jwt_algorithm: str = "HS256",
+                 clock=time.monotonic, shared=None, shared_groups: str = SHARED_GROUPS,
+                 wall_clock=time.time):
+        self.limits = limits if limits is not None else load_limits()
+        self.jwt_secret = jwt_secret
+        self.jwt_algorithm = jwt_algorithm
+        self.clock = clock
+        self.shared = shared
+        self.shared_groups = None if shared_groups.strip() == "*" else {
+            g.strip() for g in shared_groups.split(",") if g.strip()
+        }
+        self.wall_clock = wall_clock
+        self.buckets: Dict[tuple, list] = {}
+        self._tokens: Dict[str, Optional[str]] = {}
+        self._next_sweep = clock() + SWEEP_INTERVAL_SECONDS
+
+    def reset(self):
+        self.buckets.clear()
+        self._tokens.clear()
+
+    def user_for(self, authorization: Optional[str]) -> Optional[str]:
+        """User id from a bearer token, verified once per distinct token."""
+        if not authorization or not authorization.startswith("Bearer "):
+            return None
+        try:
+            return self._tokens[authorization]
+        except KeyError:
+            pass
+        try:
+            payload = jwt.decode(authorization[7:], self.jwt_secret, algorithms=[self.jwt_algorithm])
+            user_id = payload.get("user_id")
+        except jwt.InvalidTokenError:
+            user_id = None
+        if len(self._tokens) >= TOKEN_CACHE_SIZE:
+            self._tokens.clear()
+        self._tokens[authorization] = user_id
+        return user_id
+
+    def take(self, key: tuple, capacity: float, rate: float, now: float) -> float:
+        """Spend one token; return 0 on success or the seconds until one is available."""
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            self.buckets[key] = [capacity - 1, now]
+            return 0.0
+        tokens = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+        bucket[0] = tokens
+        return (1 - tokens) / rate
+
+    def check(self, group: str, ip: str, user_id: Optional[str]) -> float:
+        """Return 0 if the request may proceed, else the Retry-After in seconds."""
+        now = self.clock()
+        if now >= self._next_sweep:
+            self.sweep(now)
+
+        scopes = self.limits.get(group)
+        if not scopes:
+            return 0.0
+        wait = 0.0
+        limit = scopes.get("ip")
+        if limit:
+            wait = self.take((group, "ip", ip), limit[0], limit[1], now)
+        limit = scopes.get("user")
+        if limit and user_id and not wait:
+            wait = self.take((group, "user", user_id), limit[0], limit[1], now)
+        return wait
+
+    def is_shared(self, group: str) -> bool:
+        return self.shared is not None and (self.shared_groups is None or group in self.shared_groups)
+
+    async def check_shared(self, group: str, ip: str, user_id: Optional[str]) -> float:
+        """Count the request in the cross-worker window; same contract as ``check``."""
+        scopes = self.limits.get(group) or {}
+        now = self.wall_clock()
+        windows = []
+        for scope, identity in (("ip", ip), ("user", user_id)):
+            limit = scopes.get(scope)
+            if not limit or not identity:
+                continue
+            capacity, rate = limit
+            window = capacity / rate
+            index = int(now // window)
+            windows.append((f"ratelimit:{group}:{scope}:{identity}:{index}", capacity, (index + 1) * window))
+        if not windows:
+            return 0.0
+        try:
+            # Both scopes in one round trip's worth of latency
+            counts = await asyncio.gather(*(
+                self.shared.incr(key, 1, datetime.fromtimestamp(ends, timezone.utc))
+                for key, _, ends in windows
+            ))
+        except Exception as e:
+            # Fail open to the local buckets rather than rejecting everything
+            logging.warning(f"Shared rate limit unavailable: {e}")
+            return 0.0
+        wait = 0.0
+        for (_, capacity, ends), count in zip(windows, counts):
+            if count > capacity:
+                wait = max(wait, ends - now)
+        return wait
+
+    def sweep(self, now: float):
+        self._next_sweep = now + SWEEP_INTERVAL_SECONDS
+        horizon = now - IDLE_SECONDS
+        self.buckets = {key: bucket for key, bucket in self.buckets.items() if bucket[1] > horizon}
+
+
+def client_ip(scope, forwarded_for: Optional[bytes]) -> str:
+    global _proxy_hops_reported
+    if PROXY_HOPS and forwarded_for:
+        hops = forwarded_for.decode("latin-1").split(",")
+        return hops[max(0, len(hops) - PROXY_HOPS)].strip()
+    if PROXY_HOPS is None and forwarded_for and not _proxy_hops_reported:
+        _proxy_hops_reported = True
+        logging.error(
+            "X-Forwarded-For received but RATE_LIMIT_PROXY_HOPS is not set; rate limits key on the "
+            "socket peer, so behind a proxy every client shares one bucket. Set it to the number of "
+            "trusted proxies, or 0 if there are none."
+        )
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class RateLimitMiddleware:
+    """Pure ASGI middleware answering 429 with Retry-After once a bucket is empty."""
+
+    def __init__(self, app, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        group = route_group(scope["method"], scope["path"])
+        if group is None:
+            return await self.app(scope, receive, send)
+
+        authorization = forwarded_for = None
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                authorization = value.decode("latin-1")
+            elif name == b"x-forwarded-for":
+                forwarded_for = value
+        ip, user_id = client_ip(scope, forwarded_for), self.limiter.user_for(authorization)
+        wait = self.limiter.check(group, ip, user_id)
+        if not wait and self.limiter.is_shared(group):
+            wait = await self.limiter.check_shared(group, ip, user_id)
+        if not wait:
+            return await self.app(scope, receive, send)
+
+        body = b'{"detail":"Too many requests"}'
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(wait))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,228 @@
+import heapq
+import math
+import os
+import re
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Tuple
+
+# Tokens are runs of word characters; Luau identifiers such as
+# `RemoteEvent` or `player_data` stay intact and are matched case-insensitively.
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+SNIPPET_CHARS = 160
+MAX_QUERY_TERMS = 16
+
+# BM25 parameters used by the in-memory fallback index.
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Characters of indexed text kept in memory across all users; the least
+# recently searched users are dropped beyond it and reloaded on demand.
+INDEX_BUDGET_CHARS = int(os.environ.get('SEARCH_INDEX_MAX_CHARS', str(64 * 1024 * 1024)))
+
+
+def tokenize(text: str) -> List[str]:
+    return [t.lower() for t in TOKEN_RE.findall(text or "")]
+
+
+def query_terms(query: str) -> List[str]:
+    """Unique query terms in the order they were typed."""
+    seen = []
+    for term in tokenize(query):
+        if term not in seen:
+            seen.append(term)
+    return seen[:MAX_QUERY_TERMS]
+
+
+def make_snippet(text: str, terms: Iterable[str], width: int = SNIPPET_CHARS) -> Tuple[str, List[List[int]]]:
+    """Cut a window of ``text`` around the first matching term.
+
+    Returns the snippet and a list of ``[start, end)`` offsets of every term
+    occurrence inside it, so clients can highlight without us emitting markup.
+    """
+    text = text or ""
+    terms = set(terms)
+    matches = [m for m in TOKEN_RE.finditer(text) if m.group(0).lower() in terms]
+
+    if len(text) <= width:
+        return text, [[m.start(), m.end()] for m in matches]
+
+    first = matches[0].start() if matches else 0
+    start = max(0, min(first - width // 3, len(text) - width))
+    end = start + width
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if end < len(text) else ""
+    shift = len(prefix) - start
+
+    snippet = prefix + text[start:end] + suffix
+    highlights = [
+        [m.start() + shift, m.end() + shift]
+        for m in matches
+        if m.start() >= start and m.end() <= end
+    ]
+    return snippet, highlights
+
+
+class _UserIndex:
+    """Inverted index over one user's project names and messages."""
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.docs: Dict[str, dict] = {}
+        self.lengths: Dict[str, int] = {}
+        self.total_length = 0
+        self.chars = 0
+
+    def add(self, key: str, doc: dict, text: str):
+        if key in self.docs:
+            self.remove(key)
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[key] = tf
+        length = sum(counts.values())
+        self.docs[key] = doc
+        self.lengths[key] = length
+        self.total_length += length
+        self.chars += len(text)
+
+    def remove(self, key: str):
+        doc = self.docs.pop(key, None)
+        if doc is None:
+            return
+        self.total_length -= self.lengths.pop(key, 0)
+        self.chars -= len(doc["text"])
+        for term in set(tokenize(doc["text"])):
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(key, None)
+                if not posting:
+                    del self.postings[term]
+
+    def search(self, terms: List[str], n: int) -> List[Tuple[float, str]]:
+        n_docs = len(self.docs)
+        if not n_docs:
+            return []
+        avg_len = self.total_length / n_docs or 1.0
+        scores: Dict[str, float] = {}
+        for term in terms:
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            for key, tf in posting.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[key] / avg_len)
+                scores[key] = scores.get(key, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return heapq.nlargest(n, ((score, key) for key, score in scores.items()))
+
+
+class InvertedIndex:
+    """Pure-Python fallback for deployments without a Mongo text index.
+
+    The index is partitioned per user so a search only ever touches the
+    caller's own documents. Partitions are built lazily on a user's first
+    search and kept current by the write paths in ``server.py``. Once the
+    indexed text exceeds ``budget_chars`` the least recently searched
+    partitions are dropped; the most recent one is always kept.
+    """
+
+    def __init__(self, budget_chars: int = INDEX_BUDGET_CHARS):
+        self.budget_chars = budget_chars
+        self.chars = 0
+        self._users: "OrderedDict[str, _UserIndex]" = OrderedDict()
+
+    def is_loaded(self, user_id: str) -> bool:
+        return user_id in self._users
+
+    def load_user(self, user_id: str, projects: Iterable[dict], messages: Iterable[dict]):
+        self.drop_user(user_id)
+        index = _UserIndex()
+        for project in projects:
+            self._add_project(index, project)
+        for message in messages:
+            self._add_message(index, message)
+        self._users[user_id] = index
+        self.chars += index.chars
+        self._evict()
+
+    def drop_user(self, user_id: str):
+        index = self._users.pop(user_id, None)
+        if index is not None:
+            self.chars -= index.chars
+
+    def add_project(self, user_id: str, project: dict):
+        index = self._users.get(user_id)
+        if index is not None:
+            before = index.chars
+            self._add_project(index, project)
+            self.chars += index.chars - before
+            self._evict()
+
+    def add_message(self, user_id: str, message: dict):
+        index = self._users.get(user_id)
+        if index is not None:
+            before = index.chars
+            self._add_message(index, message)
+            self.chars += index.chars - before
+            self._evict()
+
+    def remove_project(self, user_id: str, project_id: str):
+        index = self._users.get(user_id)
+        if index is None:
+            return
+        before = index.chars
+        doomed = [key for key, doc in index.docs.items() if doc["project_id"] == project_id]
+        for key in doomed:
+            index.remove(key)
+        self.chars += index.chars - before
+
+    def _evict(self):
+        while self.chars > self.budget_chars and len(self._users) > 1:
+            _, index = self._users.popitem(last=False)
+            self.chars -= index.chars
+
+    def search(self, user_id: str, query: str, skip: int, limit: int) -> List[dict]:
+        """Return up to ``limit`` ranked hits after skipping ``skip``."""
+        index = self._users.get(user_id)
+        terms = query_terms(query)
+        if index is None or not terms:
+            return []
+        self._users.move_to_end(user_id)
+        ranked = index.search(terms, skip + limit)[skip:]
+        return [dict(index.docs[key], score=score) for score, key in ranked]
+
+    @staticmethod
+    def _add_project(index: _UserIndex, project: dict):
+        index.add("p:" + project["id"], {
+            "type": "project",
+            "project_id": project["id"],
+            "message_id": None,
+            "role": None,
+            "text": project["name"],
+            "created_at": project.get("created_at"),
+        }, project["name"])
+
+    @staticmethod
+    def _add_message(index: _UserIndex, message: dict):
+        index.add("m:" + message["id"], {
+            "type": "message",
+            "project_id": message["project_id"],
+            "message_id": message["id"],
+            "role": message.get("role"),
+            "text": message["content"],
+            "created_at": message.get("created_at"),
+        }, message["content"])
+
+
+def build_hit(doc: dict, terms: List[str], project_names: Dict[str, str]) -> dict:
+    snippet, highlights = make_snippet(doc["text"], terms)
+    return {
+        "type": doc["type"],
+        "project_id": doc["project_id"],
+        "project_name": project_names.get(doc["project_id"], ""),
+        "message_id": doc.get("message_id"),
+        "role": doc.get("role"),
+        "snippet": snippet,
+        "highlights": highlights,
+        "score": round(float(doc.get("score", 0.0)), 4),
+        "created_at": doc.get("created_at"),
+    }
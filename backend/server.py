@@ -1,8 +1,9 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Request
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Request, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import DuplicateKeyError, OperationFailure
 import os
 import logging
 from pathlib import Path
@@ -15,15 +16,54 @@ import jwt
 import httpx
 import json
 import asyncio
+import time
+
+PROCESS_STARTED = time.perf_counter()
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Local modules read their settings from the environment at import time
+import upstream
+from coalesce import SingleFlight
+from profiling import DEFAULT_INTERVAL_MS, FORMATS, MAX_SECONDS, LoopProfiler, ProfileBusy, collapsed, speedscope
+from prompts import PromptRegistry, build_messages, history_skip, HISTORY_LIMIT, HISTORY_STEP
+from ratelimit import RateLimiter, RateLimitMiddleware
+from shared_state import create_shared_state, worker_count
+from search import InvertedIndex, build_hit, query_terms
+from storage import MESSAGE_ORDER, decode_message, encode_message
+from usage import GRANULARITIES, UsageRecorder, bucket_start, parse_usage, rollup_increments, summarize
+from write_behind import WriteBehindBuffer
+from transfer import (
+    ArchiveError, EXPORT_BATCH_SIZE, IMPORT_BATCH_SIZE,
+    export_lines, iter_lines, parse_record, validate_message, validate_project
+)
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# A few pooled connections are opened in the background at startup so the
+# first requests do not pay for connection setup
+client = AsyncIOMotorClient(mongo_url, minPoolSize=int(os.environ.get('MONGO_MIN_POOL_SIZE', '5')))
 db = client[os.environ['DB_NAME']]
 
+# Quota counters and cache invalidations shared by every worker process
+shared_state = create_shared_state(db)
+# Chat writes are batched when WRITE_BEHIND=1; otherwise this writes through.
+# Queued writes are only visible to this process, so batching is refused
+# whenever requests can reach another worker, including when the worker
+# count cannot be confirmed (gunicorn, uvicorn --workers without
+# WEB_CONCURRENCY); set WEB_CONCURRENCY=1 to run one such worker.
+write_buffer = WriteBehindBuffer(lambda: db)
+if write_buffer.enabled and (shared_state.backend.name != "memory" or worker_count() != 1):
+    raise ValueError(
+        "WRITE_BEHIND=1 requires SHARED_STATE_BACKEND=memory and a single worker "
+        "(set WEB_CONCURRENCY=1 when running under a process manager)"
+    )
+
+USER_CACHE_TTL = 60
+PROJECTS_CACHE_TTL = 30
+FREE_DAILY_CHAT_LIMIT = 10
+
 # JWT Config
 JWT_SECRET = os.environ.get('JWT_SECRET', 'notfox-secret-key')
 JWT_ALGORITHM = "HS256"
@@ -33,6 +73,18 @@ JWT_EXPIRATION_HOURS = 24
 OPENROUTER_API_KEY = os.environ.get('OPENROUTER_API_KEY', '')
 STRIPE_API_KEY = os.environ.get('STRIPE_API_KEY', '')
 
+# Health Config
+READINESS_TIMEOUT_SECONDS = 2.0
+
+# Admin Config: users with role "admin" or one of these emails may use /api/admin
+ADMIN_EMAILS = {e.strip().lower() for e in os.environ.get('ADMIN_EMAILS', '').split(',') if e.strip()}
+
+# Search Config: "auto" uses the Mongo text index and falls back to the
+# in-process inverted index when it is unavailable; "mongo"/"memory" force one.
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'auto')
+TEXT_INDEX_MISSING = 27  # IndexNotFound
+TEXT_SEARCH_RETRY_SECONDS = 300
+
 # Create the main app
 app = FastAPI(title="NotFox Development AI")
 
@@ -77,6 +129,10 @@ class ProjectResponse(BaseModel):
     created_at: str
     updated_at: str
 
+class ProjectImportResponse(BaseModel):
+    project: ProjectResponse
+    messages_imported: int
+
 class MessageCreate(BaseModel):
     content: str
     project_id: str
@@ -94,6 +150,33 @@ class ChatRequest(BaseModel):
     message: str
     model: str = "nex-agi/deepseek-v3.1-nex-n1:free"
 
+class SearchHit(BaseModel):
+    type: str  # project or message
+    project_id: str
+    project_name: str
+    message_id: Optional[str] = None
+    role: Optional[str] = None
+    snippet: str
+    highlights: List[List[int]]
+    score: float
+    created_at: Optional[str] = None
+
+class SearchResponse(BaseModel):
+    query: str
+    page: int
+    limit: int
+    has_more: bool
+    backend: str
+    results: List[SearchHit]
+
+class UsageResponse(BaseModel):
+    granularity: str
+    start: str
+    end: str
+    totals: Dict[str, Any]
+    by_model: Dict[str, Dict[str, Any]]
+    buckets: List[Dict[str, Any]]
+
 class ThemeUpdate(BaseModel):
     theme: str
 
@@ -130,7 +213,11 @@ async def get_current_user(authorization: Optional[str] = Header(None)) -> dict:
     token = authorization.split(" ")[1]
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user = await db.users.find_one({"id": payload["user_id"]}, {"_id": 0})
+        user = await shared_state.cached(
+            f"user:{payload['user_id']}",
+            USER_CACHE_TTL,
+            lambda: db.users.find_one({"id": payload["user_id"]}, {"_id": 0})
+        )
         if not user:
             raise HTTPException(status_code=401, detail="User not found")
         return user
@@ -139,6 +226,11 @@ async def get_current_user(authorization: Optional[str] = Header(None)) -> dict:
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+async def require_admin(user: dict = Depends(get_current_user)) -> dict:
+    if user.get("role") != "admin" and user.get("email", "").lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user
+
 # ============= AUTH ROUTES =============
 
 @api_router.post("/auth/register", response_model=TokenResponse)
@@ -168,7 +260,13 @@ async def register(user_data: UserCreate):
         "updated_at": now
     }
     
-    await db.users.insert_one(user_doc)
+    # The unique indexes settle registrations that raced past the checks above
+    try:
+        await db.users.insert_one(user_doc)
+    except DuplicateKeyError as e:
+        if "username" in (e.details or {}).get("keyPattern", {}):
+            raise HTTPException(status_code=400, detail="Username already taken")
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     token = create_token(user_id, user_data.email)
     
@@ -225,10 +323,25 @@ async def update_theme(theme_data: ThemeUpdate, user: dict = Depends(get_current
         {"id": user["id"]},
         {"$set": {"theme": theme_data.theme, "updated_at": datetime.now(timezone.utc).isoformat()}}
     )
+    await shared_state.invalidate(f"user:{user['id']}")
     return {"message": "Theme updated", "theme": theme_data.theme}
 
 # ============= PROJECT ROUTES =============
 
+# Concurrent identical reads share one query. Flights are tagged with the
+# resource they read: ("projects", user_id) or ("messages", project_id);
+# every write to that resource must call read_flights.invalidate().
+read_flights = SingleFlight()
+
+async def invalidate_projects(user_id: str):
+    read_flights.invalidate(("projects", user_id))
+    await shared_state.invalidate(f"projects:{user_id}")
+
+async def sync_search_index(user_id: str):
+    # Other workers' in-memory indexes cannot see this write; drop theirs
+    if not text_search_available:
+        await shared_state.invalidate(f"search:{user_id}", local=False)
+
 @api_router.post("/projects", response_model=ProjectResponse)
 async def create_project(project_data: ProjectCreate, user: dict = Depends(get_current_user)):
     project_id = str(uuid.uuid4())
@@ -244,23 +357,35 @@ async def create_project(project_data: ProjectCreate, user: dict = Depends(get_c
     }
     
     await db.projects.insert_one(project_doc)
+    await invalidate_projects(user["id"])
+    search_index.add_project(user["id"], project_doc)
+    await sync_search_index(user["id"])
     
     return ProjectResponse(**project_doc)
 
 @api_router.get("/projects", response_model=List[ProjectResponse])
 async def get_projects(user: dict = Depends(get_current_user)):
-    projects = await db.projects.find(
-        {"user_id": user["id"]},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(100)
-    return projects
+    async def query():
+        return await db.projects.find(
+            {"user_id": user["id"]},
+            {"_id": 0}
+        ).sort("created_at", -1).to_list(100)
+    
+    return await shared_state.cached(
+        f"projects:{user['id']}",
+        PROJECTS_CACHE_TTL,
+        lambda: read_flights.do((user["id"], "projects"), ("projects", user["id"]), query)
+    )
 
 @api_router.get("/projects/{project_id}", response_model=ProjectResponse)
 async def get_project(project_id: str, user: dict = Depends(get_current_user)):
-    project = await db.projects.find_one(
-        {"id": project_id, "user_id": user["id"]},
-        {"_id": 0}
-    )
+    async def query():
+        return await db.projects.find_one(
+            {"id": project_id, "user_id": user["id"]},
+            {"_id": 0}
+        )
+    
+    project = await read_flights.do((user["id"], "project", project_id), ("projects", user["id"]), query)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     return project
@@ -270,27 +395,132 @@ async def delete_project(project_id: str, user: dict = Depends(get_current_user)
     result = await db.projects.delete_one({"id": project_id, "user_id": user["id"]})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Project not found")
+    await invalidate_projects(user["id"])
     
-    # Delete associated messages
+    # Delete associated messages, including any still queued for write
+    await write_buffer.sync(project_id)
     await db.messages.delete_many({"project_id": project_id})
+    read_flights.invalidate(("messages", project_id))
+    search_index.remove_project(user["id"], project_id)
+    await sync_search_index(user["id"])
     
     return {"message": "Project deleted"}
 
-# ============= CHAT/MESSAGE ROUTES =============
-
-@api_router.get("/messages/{project_id}", response_model=List[MessageResponse])
-async def get_messages(project_id: str, user: dict = Depends(get_current_user)):
-    # Verify project ownership
-    project = await db.projects.find_one({"id": project_id, "user_id": user["id"]})
+@api_router.get("/projects/{project_id}/export")
+async def export_project(project_id: str, user: dict = Depends(get_current_user)):
+    project = await db.projects.find_one(
+        {"id": project_id, "user_id": user["id"]},
+        {"_id": 0}
+    )
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    messages = await db.messages.find(
+    # Stream straight off the cursor so memory stays flat however long the project is
+    await write_buffer.sync(project_id)
+    cursor = db.messages.find(
         {"project_id": project_id},
         {"_id": 0}
-    ).sort("created_at", 1).to_list(1000)
+    ).sort(MESSAGE_ORDER).batch_size(EXPORT_BATCH_SIZE)
+    
+    return StreamingResponse(
+        export_lines(project, (decode_message(m) async for m in cursor)),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="project-{project_id}.ndjson"'}
+    )
+
+@api_router.post("/projects/import", response_model=ProjectImportResponse)
+async def import_project(request: Request, user: dict = Depends(get_current_user)):
+    project_id = str(uuid.uuid4())
+    now = datetime.now(timezone.utc).isoformat()
+    project_doc = None
+    batch = []
+    imported = 0
+    completed = False
+    
+    async def roll_back():
+        await db.projects.delete_one({"id": project_id})
+        await db.messages.delete_many({"project_id": project_id})
+        await invalidate_projects(user["id"])
+    
+    try:
+        async for line_no, line in iter_lines(request.stream()):
+            record = parse_record(line_no, line)
+            
+            if project_doc is None:
+                source = validate_project(line_no, record)
+                project_doc = {
+                    "id": project_id,
+                    "name": source["name"],
+                    "project_type": source.get("project_type") or "roblox_game",
+                    "user_id": user["id"],
+                    "created_at": now,
+                    "updated_at": now
+                }
+                continue
+            
+            message = validate_message(line_no, record)
+            # Ids are always reissued so an archive can be imported more than once
+            batch.append({
+                "id": str(uuid.uuid4()),
+                "project_id": project_id,
+                "role": message["role"],
+                "content": message["content"],
+                "created_at": message["created_at"]
+            })
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                await db.messages.insert_many([encode_message(m) for m in batch], ordered=False)
+                imported += len(batch)
+                batch = []
+        
+        if project_doc is None:
+            raise ArchiveError(1, "archive is empty")
+        if batch:
+            await db.messages.insert_many([encode_message(m) for m in batch], ordered=False)
+            imported += len(batch)
+        # The project is created last so it never shows up half-imported
+        await db.projects.insert_one(project_doc)
+        completed = True
+    except ArchiveError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid archive: {e}")
+    finally:
+        # Any failure, including the client dropping the upload, undoes the import
+        if not completed and project_doc is not None:
+            await asyncio.shield(roll_back())
+    
+    await invalidate_projects(user["id"])
+    # Rebuilt lazily on the next search rather than indexing the import inline
+    search_index.drop_user(user["id"])
+    await sync_search_index(user["id"])
+    
+    project_doc.pop("_id", None)
+    return ProjectImportResponse(project=ProjectResponse(**project_doc), messages_imported=imported)
+
+# ============= CHAT/MESSAGE ROUTES =============
+
+@api_router.get("/messages/{project_id}", response_model=List[MessageResponse])
+async def get_messages(project_id: str, user: dict = Depends(get_current_user)):
+    async def query():
+        # Verify project ownership
+        project = await db.projects.find_one({"id": project_id, "user_id": user["id"]})
+        if not project:
+            return None
+        
+        # Same-worker reads see chat turns still queued for write
+        await write_buffer.sync(project_id)
+        messages = await db.messages.find(
+            {"project_id": project_id},
+            {"_id": 0}
+        ).sort(MESSAGE_ORDER).to_list(1000)
+        return [decode_message(m) for m in messages]
+    
+    messages = await read_flights.do((user["id"], "messages", project_id), ("messages", project_id), query)
+    if messages is None:
+        raise HTTPException(status_code=404, detail="Project not found")
     return messages
 
+upstream_breaker = upstream.CircuitBreaker()
+prompt_registry = PromptRegistry()
+
 @api_router.post("/chat")
 async def chat(chat_request: ChatRequest, user: dict = Depends(get_current_user)):
     # Verify project ownership
@@ -298,26 +528,28 @@ async def chat(chat_request: ChatRequest, user: dict = Depends(get_current_user)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    # Check rate limits for free users
+    # Check rate limits for free users. The slot is reserved atomically up
+    # front so concurrent requests on any worker cannot overshoot the cap,
+    # and handed back if the AI call fails. Under write-behind the count is
+    # kept in this (only) worker and persisted with the next flush.
+    quota_incr = write_buffer.incr if write_buffer.enabled else shared_state.incr
+    quota_key = None
     if user.get("subscription_tier", "free") == "free":
-        last_reset = user.get("last_chat_reset", "")
-        chat_count = user.get("chat_count_today", 0)
-        
-        if last_reset:
-            last_reset_dt = datetime.fromisoformat(last_reset.replace('Z', '+00:00'))
-            if datetime.now(timezone.utc) - last_reset_dt > timedelta(hours=24):
-                chat_count = 0
-                await db.users.update_one(
-                    {"id": user["id"]},
-                    {"$set": {"chat_count_today": 0, "last_chat_reset": datetime.now(timezone.utc).isoformat()}}
-                )
+        today = datetime.now(timezone.utc).date()
+        quota_key = f"chat_quota:{user['id']}:{today.isoformat()}"
+        quota_expires = datetime.combine(today + timedelta(days=2), datetime.min.time(), tzinfo=timezone.utc)
         
-        if chat_count >= 10:
+        if await quota_incr(quota_key, 1, quota_expires) > FREE_DAILY_CHAT_LIMIT:
+            await quota_incr(quota_key, -1, quota_expires)
             raise HTTPException(
                 status_code=429, 
                 detail="Daily chat limit reached. Upgrade to premium for unlimited chats."
             )
     
+    async def release_quota():
+        if quota_key:
+            await quota_incr(quota_key, -1, quota_expires)
+    
     # Save user message
     user_msg_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc).isoformat()
@@ -329,75 +561,105 @@ async def chat(chat_request: ChatRequest, user: dict = Depends(get_current_user)
         "content": chat_request.message,
         "created_at": now
     }
-    await db.messages.insert_one(user_message_doc)
-    
-    # Get conversation history
-    history = await db.messages.find(
-        {"project_id": chat_request.project_id},
-        {"_id": 0}
-    ).sort("created_at", 1).to_list(50)
+    await write_buffer.insert_message(encode_message(user_message_doc), user_message_doc)
+    read_flights.invalidate(("messages", chat_request.project_id))
+    search_index.add_message(user["id"], user_message_doc)
     
-    messages = [
-        {
-            "role": "system",
-            "content": """You are NotFox AI, a specialized assistant for Roblox game development. 
-You help developers create Lua/Luau scripts, game mechanics, UI systems, and more.
-When providing code, always use proper Lua syntax highlighting.
-Be concise and helpful. Format code in markdown code blocks with 'lua' language tag."""
-        }
-    ]
+    # Get conversation history. The window always ends at the new message
+    # and starts on a fixed step so the prompt prefix stays cacheable upstream.
+    # Turns still queued for write follow the stored ones. The count and the
+    # newest messages, which always cover the window, are read concurrently
+    # so history costs one round trip; the count is index-only.
+    pending = write_buffer.pending(chat_request.project_id)
+    fetch = HISTORY_LIMIT + HISTORY_STEP
+    stored_total, recent = await asyncio.gather(
+        db.messages.count_documents({"project_id": chat_request.project_id}),
+        db.messages.find(
+            {"project_id": chat_request.project_id},
+            {"_id": 0}
+        ).sort([(field, -1) for field, _ in MESSAGE_ORDER]).limit(fetch).to_list(fetch)
+    )
+    skip = history_skip(stored_total + len(pending))
+    recent.reverse()
+    window = max(0, stored_total - skip)
+    stored = recent[max(0, len(recent) - window):] if window else []
+    history = [decode_message(m) for m in stored]
+    # A batch being flushed right now can already be visible in Mongo
+    seen = {m["id"] for m in history}
+    history += [m for m in pending[max(0, skip - stored_total):] if m["id"] not in seen]
     
-    for msg in history:
-        messages.append({
-            "role": msg["role"],
-            "content": msg["content"]
-        })
+    template = prompt_registry.get(project.get("project_type", "roblox_game"), chat_request.model)
+    messages = build_messages(template, history)
     
     # Call OpenRouter API
+    if not upstream_breaker.allow():
+        await release_quota()
+        raise HTTPException(status_code=503, detail="AI service temporarily unavailable")
+    
+    started = time.perf_counter()
     try:
-        async with httpx.AsyncClient(timeout=60.0) as http_client:
-            response = await http_client.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                    "Content-Type": "application/json",
-                    "HTTP-Referer": "https://notfox.ai",
-                    "X-Title": "NotFox Development AI"
-                },
-                json={
-                    "model": chat_request.model,
-                    "messages": messages
-                }
-            )
-            
-            if response.status_code != 200:
-                raise HTTPException(status_code=500, detail=f"AI service error: {response.text}")
-            
-            data = response.json()
-            ai_content = data["choices"][0]["message"]["content"]
-            
+        response = await upstream.get_client().post(
+            upstream.OPENROUTER_CHAT_URL,
+            headers={
+                "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+                "Content-Type": "application/json",
+                "HTTP-Referer": "https://notfox.ai",
+                "X-Title": "NotFox Development AI"
+            },
+            json={
+                "model": chat_request.model,
+                "messages": messages,
+                "usage": {"include": True}
+            }
+        )
+        
+        if response.status_code != 200:
+            if response.status_code >= 500:
+                upstream_breaker.record_failure()
+            raise HTTPException(status_code=500, detail=f"AI service error: {response.text}")
+        
+        data = response.json()
+        ai_content = data["choices"][0]["message"]["content"]
+        usage = parse_usage(data)
+        upstream_breaker.record_success()
+        
     except httpx.TimeoutException:
+        upstream_breaker.record_failure()
+        await release_quota()
         raise HTTPException(status_code=504, detail="AI service timeout")
     except Exception as e:
         logging.error(f"OpenRouter error: {e}")
+        if not isinstance(e, HTTPException):
+            upstream_breaker.record_failure()
+        await release_quota()
         raise HTTPException(status_code=500, detail="AI service unavailable")
+    latency_ms = (time.perf_counter() - started) * 1000
     
-    # Save AI response
+    # Save AI response; the turn's usage rides along on the same insert
     ai_msg_id = str(uuid.uuid4())
+    replied_at = datetime.now(timezone.utc)
     ai_message_doc = {
         "id": ai_msg_id,
         "project_id": chat_request.project_id,
         "role": "assistant",
         "content": ai_content,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": replied_at.isoformat(),
+        "usage": dict(usage, model=chat_request.model, latency_ms=round(latency_ms, 1))
     }
-    await db.messages.insert_one(ai_message_doc)
+    await write_buffer.insert_message(encode_message(ai_message_doc), ai_message_doc)
+    read_flights.invalidate(("messages", chat_request.project_id))
+    search_index.add_message(user["id"], ai_message_doc)
+    await sync_search_index(user["id"])
     
-    # Update chat count for free users
-    if user.get("subscription_tier", "free") == "free":
-        await db.users.update_one(
-            {"id": user["id"]},
-            {"$inc": {"chat_count_today": 1}}
+    # Rollups are written in the background so they never delay the reply
+    if write_buffer.enabled:
+        write_buffer.increment("usage_rollups", rollup_increments(
+            user["id"], chat_request.project_id, chat_request.model, usage, latency_ms, replied_at
+        ))
+    else:
+        usage_recorder.record(
+            db.usage_rollups, user["id"], chat_request.project_id, chat_request.model,
+            usage, latency_ms, replied_at
         )
     
     return {
@@ -405,6 +667,145 @@ Be concise and helpful. Format code in markdown code blocks with 'lua' language
         "ai_message": MessageResponse(**ai_message_doc)
     }
 
+# ============= USAGE ROUTES =============
+
+usage_recorder = UsageRecorder()
+
+@api_router.get("/usage", response_model=UsageResponse)
+async def get_usage(
+    granularity: str = Query("day"),
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    user: dict = Depends(get_current_user)
+):
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail="Invalid granularity")
+    
+    try:
+        end_dt = datetime.fromisoformat(end.replace('Z', '+00:00')) if end else datetime.now(timezone.utc)
+        default_span = timedelta(days=30) if granularity == "day" else timedelta(hours=48)
+        start_dt = datetime.fromisoformat(start.replace('Z', '+00:00')) if start else end_dt - default_span
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date range")
+    if start_dt.tzinfo is None:
+        start_dt = start_dt.replace(tzinfo=timezone.utc)
+    if end_dt.tzinfo is None:
+        end_dt = end_dt.replace(tzinfo=timezone.utc)
+    
+    start_bucket = bucket_start(start_dt.astimezone(timezone.utc), granularity)
+    end_bucket = bucket_start(end_dt.astimezone(timezone.utc), granularity)
+    
+    docs = await db.usage_rollups.find(
+        {
+            "scope": "user",
+            "key": user["id"],
+            "granularity": granularity,
+            "bucket": {"$gte": start_bucket, "$lte": end_bucket}
+        },
+        {"_id": 0}
+    ).to_list(None)
+    
+    return UsageResponse(granularity=granularity, start=start_bucket, end=end_bucket, **summarize(docs))
+
+# ============= SEARCH ROUTES =============
+
+search_index = InvertedIndex()
+text_search_available = SEARCH_BACKEND != "memory"
+# After falling back, Mongo is tried again from time to time in case the
+# text index has been created since
+text_search_retry_at = 0.0
+shared_state.on_invalidate("search:", lambda key: search_index.drop_user(key.split(":", 1)[1]))
+
+async def text_search(user_id: str, project_ids: List[str], query: str, fetch: int) -> List[dict]:
+    await write_buffer.sync()
+    messages = await db.messages.aggregate([
+        {"$match": {"$text": {"$search": query}, "project_id": {"$in": project_ids}}},
+        {"$sort": {"score": {"$meta": "textScore"}}},
+        {"$limit": fetch},
+        {"$project": {
+            "_id": 0, "id": 1, "project_id": 1, "role": 1, "content": 1, "content_z": 1, "codec": 1,
+            "created_at": 1, "score": {"$meta": "textScore"}
+        }}
+    ]).to_list(fetch)
+    messages = [decode_message(m) for m in messages]
+    projects = await db.projects.find(
+        {"$text": {"$search": query}, "user_id": user_id},
+        {"_id": 0, "id": 1, "name": 1, "created_at": 1, "score": {"$meta": "textScore"}}
+    ).sort([("score", {"$meta": "textScore"})]).limit(fetch).to_list(fetch)
+    
+    docs = [
+        {"type": "project", "project_id": p["id"], "text": p["name"],
+         "created_at": p.get("created_at"), "score": p["score"]}
+        for p in projects
+    ] + [
+        {"type": "message", "project_id": m["project_id"], "message_id": m["id"], "role": m.get("role"),
+         "text": m["content"], "created_at": m.get("created_at"), "score": m["score"]}
+        for m in messages
+    ]
+    docs.sort(key=lambda d: d["score"], reverse=True)
+    return docs[:fetch]
+
+async def memory_search(user_id: str, projects: List[dict], query: str, fetch: int) -> List[dict]:
+    if not search_index.is_loaded(user_id):
+        await write_buffer.sync()
+        messages = await db.messages.find(
+            {"project_id": {"$in": [p["id"] for p in projects]}},
+            {"_id": 0, "id": 1, "project_id": 1, "role": 1, "content": 1, "content_z": 1, "codec": 1, "created_at": 1}
+        ).to_list(None)
+        search_index.load_user(user_id, projects, map(decode_message, messages))
+    return search_index.search(user_id, query, 0, fetch)
+
+@api_router.get("/search", response_model=SearchResponse)
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    page: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=50),
+    user: dict = Depends(get_current_user)
+):
+    global text_search_available, text_search_retry_at
+    
+    terms = query_terms(q)
+    skip = (page - 1) * limit
+    # One extra hit tells us whether another page exists without counting
+    fetch = skip + limit + 1
+    
+    projects = await db.projects.find(
+        {"user_id": user["id"]},
+        {"_id": 0, "id": 1, "name": 1, "created_at": 1}
+    ).to_list(None)
+    project_names = {p["id"]: p["name"] for p in projects}
+    
+    docs = []
+    if not text_search_available and SEARCH_BACKEND == "auto" and time.monotonic() >= text_search_retry_at:
+        text_search_available = True
+    backend = "mongo" if text_search_available else "memory"
+    if terms and projects:
+        if text_search_available:
+            try:
+                docs = await text_search(user["id"], list(project_names), q, fetch)
+            except OperationFailure as e:
+                # Only a missing text index is permanent; timeouts and
+                # interrupted operations must not move every user to memory
+                if SEARCH_BACKEND == "mongo" or e.code != TEXT_INDEX_MISSING:
+                    logging.error(f"Text search error: {e}")
+                    raise HTTPException(status_code=503, detail="Search unavailable")
+                logging.warning(f"Mongo text search unavailable, using in-memory index: {e}")
+                text_search_available = False
+                text_search_retry_at = time.monotonic() + TEXT_SEARCH_RETRY_SECONDS
+                backend = "memory"
+        if not text_search_available:
+            docs = await memory_search(user["id"], projects, q, fetch)
+    
+    page_docs = docs[skip:skip + limit]
+    return SearchResponse(
+        query=q,
+        page=page,
+        limit=limit,
+        has_more=len(docs) > skip + limit,
+        backend=backend,
+        results=[SearchHit(**build_hit(doc, terms, project_names)) for doc in page_docs]
+    )
+
 # ============= SUBSCRIPTION/PAYMENT ROUTES =============
 
 SUBSCRIPTION_PLANS = {
@@ -485,6 +886,7 @@ async def get_payment_status(session_id: str, user: dict = Depends(get_current_u
                     {"id": user["id"]},
                     {"$set": {"subscription_tier": "premium", "updated_at": datetime.now(timezone.utc).isoformat()}}
                 )
+                await shared_state.invalidate(f"user:{user['id']}")
         
         return {
             "status": status.status,
@@ -515,6 +917,7 @@ async def stripe_webhook(request: Request):
                     {"id": user_id},
                     {"$set": {"subscription_tier": "premium"}}
                 )
+                await shared_state.invalidate(f"user:{user_id}")
                 
                 await db.payment_transactions.update_one(
                     {"session_id": webhook_response.session_id},
@@ -542,19 +945,84 @@ async def get_plugin_status(user: dict = Depends(get_current_user)):
         "message": "Plugin not connected"
     }
 
+# ============= ADMIN ROUTES =============
+
+profiler = LoopProfiler()
+
+@api_router.post("/admin/profile")
+async def profile(
+    seconds: float = Query(5.0, gt=0, le=MAX_SECONDS),
+    interval_ms: float = Query(DEFAULT_INTERVAL_MS, ge=1, le=100),
+    format: str = Query("speedscope"),
+    user: dict = Depends(require_admin)
+):
+    # Samples the event loop of the worker that serves this request only
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid format")
+    try:
+        result = await profiler.run(seconds, interval_ms)
+    except ProfileBusy:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    
+    samples = result.pop("samples")
+    result["format"] = format
+    result["profile"] = speedscope(samples, interval_ms) if format == "speedscope" else collapsed(samples)
+    logging.info(f"Profile taken by {user['email']}: {result['seconds']}s, {result['sample_count']} samples")
+    return result
+
 # ============= BASE ROUTES =============
 
 @api_router.get("/")
 async def root():
     return {"message": "NotFox Development AI API", "version": "1.0.0"}
 
+# Filled in by the warm-up task started at startup; readiness stays false
+# until it has finished.
+warmup_state: Dict[str, Any] = {"ready": False, "startup_ms": None, "steps": {}}
+
 @api_router.get("/health")
+@api_router.get("/health/live")
 async def health():
+    # Liveness only: the process is up and the event loop is responsive
     return {"status": "healthy"}
 
+@api_router.get("/health/ready")
+async def readiness():
+    mongo = {"ok": False}
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(db.command("ping"), READINESS_TIMEOUT_SECONDS)
+        mongo["ok"] = True
+    except asyncio.TimeoutError:
+        mongo["error"] = "ping timed out"
+    except Exception as e:
+        mongo["error"] = str(e)
+    mongo["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    
+    ready = warmup_state["ready"] and mongo["ok"]
+    body = {
+        "status": "ready" if ready else "not_ready",
+        "checks": {
+            "warmup": warmup_state,
+            "mongo": mongo,
+            # Reported but not gating: an upstream outage affects every instance alike
+            "upstream": upstream_breaker.snapshot()
+        }
+    }
+    return JSONResponse(status_code=200 if ready else 503, content=body)
+
 # Include the router in the main app
 app.include_router(api_router)
 
+# Added before CORS so that 429 responses still carry CORS headers. Limits
+# are enforced across workers only when there may be more than one; a single
+# worker's buckets already see all traffic and need no Mongo round trip.
+rate_limiter = RateLimiter(
+    jwt_secret=JWT_SECRET, jwt_algorithm=JWT_ALGORITHM,
+    shared=shared_state if shared_state.backend.name != "memory" and worker_count() != 1 else None
+)
+app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -570,6 +1038,106 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def create_messages_text_index():
+    keys = [("content", "text"), ("search_text", "text")]
+    try:
+        await db.messages.create_index(keys, name="messages_text", default_language="none")
+    except OperationFailure as e:
+        # A collection has at most one text index; replace the content-only one
+        if e.code not in (85, 86):
+            raise
+        await db.messages.drop_index("messages_content_text")
+        await db.messages.create_index(keys, name="messages_text", default_language="none")
+
+async def create_indexes():
+    # Each index is created on its own so one failure (typically duplicate
+    # users left by the old registration race) cannot block the others
+    indexes = [
+        ("users.email", lambda: db.users.create_index("email", unique=True)),
+        ("users.username", lambda: db.users.create_index("username", unique=True)),
+        # Messages are read in MESSAGE_ORDER, which is the same in both storage formats
+        ("messages.project_id", lambda: db.messages.create_index([("project_id", 1)] + MESSAGE_ORDER)),
+        ("usage_rollups.bucket", lambda: db.usage_rollups.create_index(
+            [("scope", 1), ("key", 1), ("granularity", 1), ("bucket", 1), ("model", 1)],
+            unique=True
+        )),
+    ]
+    if write_buffer.enabled:
+        # Quota counters persisted by the write-behind buffer expire like the shared ones
+        indexes.append(("state_counters.expires_at",
+                        lambda: db.state_counters.create_index("expires_at", expireAfterSeconds=0)))
+    if SEARCH_BACKEND != "memory":
+        # "none" disables stemming and stop words, which mangle code identifiers.
+        # search_text stands in for the body of compressed messages.
+        indexes.append(("messages.text", create_messages_text_index))
+        indexes.append(("projects.text", lambda: db.projects.create_index(
+            [("name", "text")], name="projects_name_text", default_language="none"
+        )))
+    
+    failed = []
+    for name, create in indexes:
+        try:
+            await create()
+        except Exception as e:
+            failed.append(name)
+            if name.startswith("users.") and getattr(e, "code", None) == 11000:
+                logging.critical(
+                    f"Unique index {name} not created because duplicate users exist; "
+                    f"registrations can race until they are merged: {e}"
+                )
+            else:
+                logging.error(f"Creating index {name} failed: {e}")
+    if failed:
+        raise RuntimeError(f"Index creation failed for {', '.join(failed)}")
+
+async def warm_up():
+    async def step(name, action):
+        started = time.perf_counter()
+        result = {"ok": True}
+        try:
+            await action()
+        except Exception as e:
+            result = {"ok": False, "error": str(e)}
+            logger.warning(f"Warm-up step {name} failed: {e}")
+        result["ms"] = round((time.perf_counter() - started) * 1000, 1)
+        warmup_state["steps"][name] = result
+    
+    async def preload():
+        upstream.preload_modules()
+    
+    await step("mongo", lambda: db.command("ping"))
+    await step("indexes", create_indexes)
+    await step("shared_state", shared_state.start)
+    await step("upstream", upstream.warm_connection)
+    await step("imports", preload)
+    
+    async def load_prompts():
+        # File I/O and tiktoken's first-use download stay off the event loop
+        await asyncio.to_thread(prompt_registry.reload)
+        await prompt_registry.start()
+    
+    await step("prompts", load_prompts)
+    
+    warmup_state["startup_ms"] = round((time.perf_counter() - PROCESS_STARTED) * 1000, 1)
+    warmup_state["ready"] = True
+    logger.info(f"Warm-up finished {warmup_state['startup_ms']}ms after process start: {warmup_state['steps']}")
+
+@app.on_event("startup")
+async def start_warm_up():
+    # Runs in the background so liveness answers while pools are opening
+    app.state.warmup_task = asyncio.create_task(warm_up())
+    write_buffer.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    app.state.warmup_task.cancel()
+    await usage_recorder.drain()
+    # Queued chat writes must land before the Mongo client goes away
+    try:
+        await write_buffer.stop()
+    except Exception as e:
+        logging.error(f"Write-behind flush at shutdown failed: {e}")
+    await shared_state.stop()
+    await prompt_registry.stop()
+    await upstream.close_client()
     client.close()
@@ -0,0 +1,260 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+# State that must agree across uvicorn/gunicorn workers lives behind a
+# backend with two primitives:
+#   incr     - atomic windowed counters (quota enforcement)
+#   publish  - an invalidation bus so every worker drops stale cache entries
+# Caches themselves stay in each worker's memory (a Mongo round trip per hit
+# would cost as much as the query being cached); the bus keeps them coherent.
+#
+#   SHARED_STATE_BACKEND=mongo   default, safe with any number of workers
+#   SHARED_STATE_BACKEND=memory  single worker only, no extra Mongo traffic
+SHARED_STATE_BACKEND = os.environ.get('SHARED_STATE_BACKEND', 'mongo')
+INVALIDATION_POLL_SECONDS = float(os.environ.get('INVALIDATION_POLL_SECONDS', '0.25'))
+LOCAL_CACHE_SIZE = int(os.environ.get('LOCAL_CACHE_SIZE', '10000'))
+
+# Invalidation documents may become visible slightly out of order across
+# workers, so each poll looks back this far and skips ids it has seen.
+INVALIDATION_GRACE = timedelta(seconds=5)
+INVALIDATION_RETENTION_SECONDS = 3600
+
+
+class MemoryBackend:
+    """Process-local backend for single-worker deployments."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._counters: Dict[str, Tuple[int, datetime]] = {}
+        self._listeners: List[Callable[[List[str]], None]] = []
+
+    async def start(self, listener: Callable[[List[str]], None]):
+        self._listeners.append(listener)
+
+    async def stop(self):
+        self._listeners.clear()
+
+    async def incr(self, key: str, amount: int, expires_at: datetime) -> int:
+        now = datetime.now(timezone.utc)
+        value, expiry = self._counters.get(key, (0, expires_at))
+        if expiry <= now:
+            value, expiry = 0, expires_at
+        value += amount
+        self._counters[key] = (value, expiry)
+        if len(self._counters) > LOCAL_CACHE_SIZE:
+            self._counters = {k: v for k, v in self._counters.items() if v[1] > now}
+        return value
+
+    async def publish(self, keys: List[str]):
+        # Only this process exists; the local cache was already cleared
+        pass
+
+
+class MongoBackend:
+    """Counters and invalidations stored in Mongo so every worker agrees."""
+
+    name = "mongo"
+
+    def __init__(self, db):
+        self.db = db
+        self.worker_id = str(uuid.uuid4())
+        self._poller: Optional[asyncio.Task] = None
+        self._listener: Optional[Callable[[List[str]], None]] = None
+        self._seen: Dict[Any, datetime] = {}
+        self._since = datetime.now(timezone.utc)
+
+    async def start(self, listener: Callable[[List[str]], None]):
+        self._listener = listener
+        try:
+            await self.db.state_counters.create_index("expires_at", expireAfterSeconds=0)
+            await self.db.state_invalidations.create_index(
+                "at", expireAfterSeconds=INVALIDATION_RETENTION_SECONDS
+            )
+        except Exception as e:
+            logging.warning(f"Shared state index creation failed: {e}")
+        self._poller = asyncio.create_task(self._poll_forever())
+
+    async def stop(self):
+        if self._poller:
+            self._poller.cancel()
+            try:
+                await self._poller
+            except asyncio.CancelledError:
+                pass
+            self._poller = None
+
+    async def incr(self, key: str, amount: int, expires_at: datetime) -> int:
+        for _ in range(2):
+            try:
+                doc = await self.db.state_counters.find_one_and_update(
+                    {"_id": key},
+                    {"$inc": {"value": amount}, "$setOnInsert": {"expires_at": expires_at}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+                return doc["value"]
+            except DuplicateKeyError:
+                # Two workers raced to create the counter; the retry updates it
+                continue
+        raise RuntimeError(f"Counter {key} could not be updated")
+
+    async def publish(self, keys: List[str]):
+        await self.db.state_invalidations.insert_one({
+            "keys": keys,
+            "worker": self.worker_id,
+            "at": datetime.now(timezone.utc)
+        })
+
+    async def poll_once(self):
+        now = datetime.now(timezone.utc)
+        cursor = self.db.state_invalidations.find({"at": {"$gte": self._since - INVALIDATION_GRACE}})
+        keys = []
+        async for doc in cursor:
+            if doc["_id"] in self._seen:
+                continue
+            self._seen[doc["_id"]] = doc["at"]
+            if doc["worker"] != self.worker_id:
+                keys.extend(doc["keys"])
+        self._since = now
+        horizon = now - INVALIDATION_GRACE * 2
+        self._seen = {k: at for k, at in self._seen.items() if _aware(at) >= horizon}
+        if keys and self._listener:
+            self._listener(keys)
+
+    async def _poll_forever(self):
+        while True:
+            await asyncio.sleep(INVALIDATION_POLL_SECONDS)
+            try:
+                await self.poll_once()
+            except Exception as e:
+                logging.warning(f"Invalidation poll failed: {e}")
+
+
+def _aware(at: datetime) -> datetime:
+    return at if at.tzinfo else at.replace(tzinfo=timezone.utc)
+
+
+class LocalCache:
+    """Bounded TTL cache for one worker; oldest entries are evicted first."""
+
+    def __init__(self, max_size: int = LOCAL_CACHE_SIZE):
+        self.max_size = max_size
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def set(self, key: str, value: Any, ttl: float):
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+
+class SharedState:
+    """Quota counters plus worker-local caches kept coherent across workers."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.cache = LocalCache()
+        self._hooks: List[Tuple[str, Callable[[str], None]]] = []
+        # key -> [loads in flight, generation]; invalidate bumps the generation
+        # so a load that started before the write does not cache its result
+        self._loading: Dict[str, List[int]] = {}
+
+    async def start(self):
+        await self.backend.start(self._apply_invalidations)
+
+    async def stop(self):
+        await self.backend.stop()
+
+    def on_invalidate(self, prefix: str, hook: Callable[[str], None]):
+        """Run ``hook(key)`` whenever a key with ``prefix`` is invalidated anywhere."""
+        self._hooks.append((prefix, hook))
+
+    async def incr(self, key: str, amount: int = 1, expires_at: Optional[datetime] = None) -> int:
+        expires_at = expires_at or datetime.now(timezone.utc) + timedelta(days=1)
+        return await self.backend.incr(key, amount, expires_at)
+
+    async def cached(self, key: str, ttl: float, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for ``key`` or load it; ``None`` is never cached."""
+        value = self.cache.get(key)
+        if value is not None:
+            return value
+        loading = self._loading.setdefault(key, [0, 0])
+        loading[0] += 1
+        generation = loading[1]
+        try:
+            value = await loader()
+        finally:
+            loading[0] -= 1
+            if not loading[0]:
+                del self._loading[key]
+        if value is not None and loading[1] == generation:
+            self.cache.set(key, value, ttl)
+        return value
+
+    async def invalidate(self, *keys: str, local: bool = True):
+        """Drop ``keys`` in every worker; ``local=False`` skips this one."""
+        if local:
+            self._apply_invalidations(keys)
+        await self.backend.publish(list(keys))
+
+    def _apply_invalidations(self, keys: Iterable[str]):
+        for key in keys:
+            self.cache.delete(key)
+            loading = self._loading.get(key)
+            if loading is not None:
+                loading[1] += 1
+            for prefix, hook in self._hooks:
+                if key.startswith(prefix):
+                    hook(key)
+
+
+def worker_count() -> Optional[int]:
+    """Worker processes serving the app, or None when that cannot be confirmed.
+
+    WEB_CONCURRENCY wins when set. Otherwise a process started directly
+    (``uvicorn server:app``) is the only worker; ``uvicorn --workers``
+    spawns its workers through multiprocessing and gunicorn forks them
+    from its arbiter, so either may have siblings this process cannot count.
+    """
+    configured = os.environ.get('WEB_CONCURRENCY')
+    if configured:
+        return int(configured)
+    if multiprocessing.parent_process() is None and "gunicorn" not in sys.modules:
+        return 1
+    return None
+
+
+def create_shared_state(db) -> SharedState:
+    if SHARED_STATE_BACKEND == "memory":
+        return SharedState(MemoryBackend())
+    if SHARED_STATE_BACKEND == "mongo":
+        return SharedState(MongoBackend(db))
+    raise ValueError("SHARED_STATE_BACKEND must be 'mongo' or 'memory'")
@@ -0,0 +1,121 @@
+import os
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from bson.binary import Binary, UuidRepresentation
+
+from search import tokenize
+
+try:
+    import zstandard
+except ImportError:  # optional, zlib is always available
+    zstandard = None
+
+# Message storage formats:
+#   legacy  - string UUID ``id``, ISO-8601 string ``created_at``, plain ``content``
+#   compact - binary UUID ``id``, BSON datetime ``created_at`` and, above the
+#             size threshold, a compressed ``content_z`` with its ``codec``
+# Reads accept both, so a collection can be migrated in place while serving.
+# ``created_at`` has a different BSON type in each format and Mongo sorts by
+# type first, so both formats also store ``created_us``, the same instant as
+# integer microseconds since the epoch, and readers sort on MESSAGE_ORDER.
+# Messages written before ``created_us`` existed sort first (they are the
+# oldest) and among themselves by their legacy ``created_at`` string; the
+# migration tool backfills the field.
+#
+# A compressed body also keeps ``search_text``, its distinct lowercased terms,
+# which the Mongo text index covers alongside ``content``. Code repeats its
+# identifiers heavily, so this is a fraction of the body's size.
+STORAGE_FORMATS = ("legacy", "compact")
+MESSAGE_ORDER = [("created_us", 1), ("created_at", 1)]
+MESSAGE_STORAGE_FORMAT = os.environ.get('MESSAGE_STORAGE_FORMAT', 'legacy')
+COMPRESSION_THRESHOLD = int(os.environ.get('MESSAGE_COMPRESSION_THRESHOLD', '2048'))
+MESSAGE_COMPRESSION = os.environ.get('MESSAGE_COMPRESSION', 'zstd' if zstandard else 'zlib')
+
+if MESSAGE_STORAGE_FORMAT not in STORAGE_FORMATS:
+    raise ValueError(f"MESSAGE_STORAGE_FORMAT must be one of {STORAGE_FORMATS}")
+if MESSAGE_COMPRESSION == 'zstd' and zstandard is None:
+    raise ValueError("MESSAGE_COMPRESSION=zstd requires the zstandard package")
+
+_zstd_compressor = zstandard.ZstdCompressor(level=3) if zstandard else None
+_zstd_decompressor = zstandard.ZstdDecompressor() if zstandard else None
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return _zstd_compressor.compress(data)
+    if codec == "zlib":
+        return zlib.compress(data, 6)
+    raise ValueError(f"Unknown codec {codec!r}")
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if _zstd_decompressor is None:
+            raise RuntimeError("zstd-compressed message found but zstandard is not installed")
+        return _zstd_decompressor.decompress(data)
+    if codec == "zlib":
+        return zlib.decompress(data)
+    raise ValueError(f"Unknown codec {codec!r}")
+
+
+def created_us(created_at: str) -> int:
+    """An ISO-8601 ``created_at`` as integer microseconds since the epoch."""
+    created = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=timezone.utc)
+    return (created - _EPOCH) // timedelta(microseconds=1)
+
+
+def search_text(content: str) -> str:
+    """Distinct terms of ``content`` in first-seen order, for the text index."""
+    return " ".join(dict.fromkeys(tokenize(content)))
+
+
+def encode_message(doc: dict, storage_format: Optional[str] = None,
+                   codec: Optional[str] = None, threshold: Optional[int] = None) -> dict:
+    """Return a copy of ``doc`` laid out for storage; the input is not modified."""
+    storage_format = storage_format or MESSAGE_STORAGE_FORMAT
+    doc = decode_message(doc)
+    doc["created_us"] = created_us(doc["created_at"])
+    if storage_format == "legacy":
+        return doc
+
+    codec = codec or MESSAGE_COMPRESSION
+    threshold = COMPRESSION_THRESHOLD if threshold is None else threshold
+    doc["id"] = Binary.from_uuid(uuid.UUID(doc["id"]), UuidRepresentation.STANDARD)
+    doc["created_at"] = datetime.fromisoformat(doc["created_at"].replace('Z', '+00:00'))
+
+    body = doc["content"].encode("utf-8")
+    if codec != "none" and len(body) > threshold:
+        packed = compress(body, codec)
+        if len(packed) < len(body):
+            del doc["content"]
+            doc["content_z"] = Binary(packed)
+            doc["codec"] = codec
+            doc["search_text"] = search_text(body.decode("utf-8"))
+    return doc
+
+
+def decode_message(doc: dict) -> dict:
+    """Return a copy of a stored message in the API's string formats."""
+    doc = dict(doc)
+    doc.pop("_id", None)
+    doc.pop("search_text", None)
+    doc.pop("created_us", None)
+
+    if isinstance(doc.get("id"), (Binary, uuid.UUID)):
+        value = doc["id"]
+        doc["id"] = str(value.as_uuid(UuidRepresentation.STANDARD) if isinstance(value, Binary) else value)
+    if isinstance(doc.get("created_at"), datetime):
+        created = doc["created_at"]
+        if created.tzinfo is None:
+            created = created.replace(tzinfo=timezone.utc)
+        doc["created_at"] = created.isoformat()
+    if "content_z" in doc:
+        doc["content"] = decompress(bytes(doc.pop("content_z")), doc.pop("codec")).decode("utf-8")
+    return doc
@@ -0,0 +1,118 @@
+import json
+from datetime import datetime
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Tuple
+
+# NDJSON project archives: one header line describing the project followed by
+# one line per message in chronological order.
+#
+#   {"type": "project", "version": 1, "project": {...}}
+#   {"type": "message", "message": {...}}
+EXPORT_FORMAT_VERSION = 1
+EXPORT_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 1000
+MAX_LINE_BYTES = 8 * 1024 * 1024
+
+PROJECT_FIELDS = ("id", "name", "project_type", "created_at", "updated_at")
+MESSAGE_FIELDS = ("id", "role", "content", "created_at")
+MESSAGE_ROLES = ("user", "assistant")
+
+
+class ArchiveError(ValueError):
+    """Raised for a malformed archive; ``line`` is 1-based."""
+
+    def __init__(self, line: int, reason: str):
+        super().__init__(f"line {line}: {reason}")
+        self.line = line
+        self.reason = reason
+
+
+def _dumps(record: dict) -> bytes:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+async def export_lines(project: dict, messages: AsyncIterable[dict]) -> AsyncIterator[bytes]:
+    """Serialize a project and its message cursor without buffering the cursor.
+
+    Lines are grouped into chunks of roughly 64KB so the response is not
+    flushed one tiny write at a time.
+    """
+    yield _dumps({
+        "type": "project",
+        "version": EXPORT_FORMAT_VERSION,
+        "project": {k: project.get(k) for k in PROJECT_FIELDS},
+    })
+    chunk = []
+    size = 0
+    async for message in messages:
+        line = _dumps({"type": "message", "message": {k: message.get(k) for k in MESSAGE_FIELDS}})
+        chunk.append(line)
+        size += len(line)
+        if size >= 64 * 1024:
+            yield b"".join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield b"".join(chunk)
+
+
+async def iter_lines(chunks: AsyncIterable[bytes], max_line_bytes: int = MAX_LINE_BYTES) -> AsyncIterator[Tuple[int, bytes]]:
+    """Split a byte stream into ``(line_number, line)`` pairs, skipping blank lines."""
+    buffer = b""
+    line_no = 0
+    async for chunk in chunks:
+        buffer += chunk
+        start = 0
+        while True:
+            end = buffer.find(b"\n", start)
+            if end < 0:
+                break
+            line_no += 1
+            line = buffer[start:end].strip()
+            start = end + 1
+            if line:
+                yield line_no, line
+        buffer = buffer[start:]
+        if len(buffer) > max_line_bytes:
+            raise ArchiveError(line_no + 1, "line too long")
+    if buffer.strip():
+        yield line_no + 1, buffer.strip()
+
+
+def parse_record(line_no: int, line: bytes) -> Dict[str, Any]:
+    try:
+        record = json.loads(line)
+    except ValueError:
+        raise ArchiveError(line_no, "invalid JSON")
+    if not isinstance(record, dict):
+        raise ArchiveError(line_no, "expected a JSON object")
+    return record
+
+
+def validate_project(line_no: int, record: dict) -> dict:
+    if record.get("type") != "project":
+        raise ArchiveError(line_no, "first record must be the project header")
+    if record.get("version") != EXPORT_FORMAT_VERSION:
+        raise ArchiveError(line_no, f"unsupported archive version {record.get('version')!r}")
+    project = record.get("project")
+    if not isinstance(project, dict) or not isinstance(project.get("name"), str) or not project["name"].strip():
+        raise ArchiveError(line_no, "project name is required")
+    if not isinstance(project.get("project_type", ""), str):
+        raise ArchiveError(line_no, "project_type must be a string")
+    return project
+
+
+def validate_message(line_no: int, record: dict) -> dict:
+    if record.get("type") != "message":
+        raise ArchiveError(line_no, f"unexpected record type {record.get('type')!r}")
+    message = record.get("message")
+    if not isinstance(message, dict):
+        raise ArchiveError(line_no, "message body is required")
+    if message.get("role") not in MESSAGE_ROLES:
+        raise ArchiveError(line_no, f"invalid role {message.get('role')!r}")
+    if not isinstance(message.get("content"), str):
+        raise ArchiveError(line_no, "message content must be a string")
+    try:
+        datetime.fromisoformat(message["created_at"].replace("Z", "+00:00"))
+    except (KeyError, AttributeError, ValueError):
+        raise ArchiveError(line_no, "message created_at must be an ISO-8601 string")
+    return message
@@ -0,0 +1,99 @@
+import importlib
+import logging
+import time
+from typing import Dict, Optional
+
+import httpx
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+OPENROUTER_CHAT_URL = f"{OPENROUTER_BASE_URL}/chat/completions"
+
+# Modules imported lazily inside request handlers; loading them during
+# warm-up keeps the import cost off the first real request.
+LAZY_MODULES = (
+    "emergentintegrations.payments.stripe.checkout",
+)
+
+
+class CircuitBreaker:
+    """Stops calling the AI upstream after repeated failures.
+
+    closed    - calls flow; ``failure_threshold`` consecutive failures open it
+    open      - calls are rejected until ``reset_timeout`` seconds pass
+    half_open - one probe call is let through; success closes the breaker,
+                failure re-opens it. A probe that never reports back (for
+                example a cancelled request) is replaced after another
+                ``reset_timeout``.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.last_failure: Optional[float] = None
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        self.last_failure = time.time()
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict:
+        retry_in = 0.0
+        if self.state != "closed":
+            retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "retry_in_seconds": round(retry_in, 1),
+        }
+
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Shared client so connections (and their TLS sessions) are reused."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=60.0,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60.0)
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def warm_connection(timeout: float = 5.0):
+    """Open a pooled connection to the upstream, paying DNS and TLS up front."""
+    await get_client().head(OPENROUTER_BASE_URL + "/", timeout=timeout)
+
+
+def preload_modules():
+    for name in LAZY_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logging.warning(f"Could not preload {name}: {e}")
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Set, Tuple
+
+from pymongo import UpdateOne
+
+# Rollups are pre-aggregated per hour and per day for three scopes:
+#   user    - one document per (user, model, bucket)
+#   model   - one document per (model, bucket) across all users
+#   project - one document per (project, model, bucket)
+# Dashboards and /api/usage read these documents and never scan messages.
+GRANULARITIES = ("hour", "day")
+COUNTER_FIELDS = ("turns", "prompt_tokens", "completion_tokens", "total_tokens", "latency_ms", "cost")
+
+
+def parse_usage(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Pull token counts (and cost, when the provider reports it) out of a completion."""
+    usage = data.get("usage") or {}
+    prompt = int(usage.get("prompt_tokens") or 0)
+    completion = int(usage.get("completion_tokens") or 0)
+    return {
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "total_tokens": int(usage.get("total_tokens") or prompt + completion),
+        "cost": float(usage.get("cost") or 0.0),
+    }
+
+
+def bucket_start(at: datetime, granularity: str) -> str:
+    if granularity == "hour":
+        at = at.replace(minute=0, second=0, microsecond=0)
+    else:
+        at = at.replace(hour=0, minute=0, second=0, microsecond=0)
+    return at.isoformat()
+
+
+def rollup_increments(user_id: str, project_id: str, model: str, usage: Dict[str, Any],
+                      latency_ms: float, at: datetime) -> List[Tuple[dict, dict, dict]]:
+    """``(filter, $inc, $setOnInsert)`` for every rollup document one turn touches."""
+    inc = {
+        "turns": 1,
+        "prompt_tokens": usage["prompt_tokens"],
+        "completion_tokens": usage["completion_tokens"],
+        "total_tokens": usage["total_tokens"],
+        "latency_ms": round(latency_ms, 1),
+        "cost": usage["cost"],
+    }
+    scopes = (("user", user_id), ("model", model), ("project", project_id))
+    increments = []
+    for granularity in GRANULARITIES:
+        bucket = bucket_start(at, granularity)
+        for scope, key in scopes:
+            increments.append((
+                {"scope": scope, "key": key, "model": model, "granularity": granularity, "bucket": bucket},
+                inc,
+                {"user_id": user_id if scope != "model" else None},
+            ))
+    return increments
+
+
+def rollup_updates(user_id: str, project_id: str, model: str, usage: Dict[str, Any],
+                   latency_ms: float, at: datetime) -> List[UpdateOne]:
+    return [
+        UpdateOne(filter_, {"$inc": inc, "$setOnInsert": on_insert}, upsert=True)
+        for filter_, inc, on_insert in rollup_increments(user_id, project_id, model, usage, latency_ms, at)
+    ]
+
+
+def summarize(docs: List[dict]) -> Dict[str, Any]:
+    """Fold user rollup documents into totals, per-model totals and a time series."""
+    def empty():
+        return {field: 0 for field in COUNTER_FIELDS}
+
+    def add(target, doc):
+        for field in COUNTER_FIELDS:
+            target[field] += doc.get(field, 0)
+
+    totals = empty()
+    by_model: Dict[str, dict] = {}
+    series: Dict[str, dict] = {}
+    for doc in docs:
+        add(totals, doc)
+        add(by_model.setdefault(doc["model"], empty()), doc)
+        add(series.setdefault(doc["bucket"], empty()), doc)
+    return {
+        "totals": totals,
+        "by_model": by_model,
+        "buckets": [dict(counters, bucket=bucket) for bucket, counters in sorted(series.items())],
+    }
+
+
+class UsageRecorder:
+    """Applies rollup updates off the request path.
+
+    ``record`` schedules a single unordered ``bulk_write`` and returns
+    immediately; ``drain`` waits for outstanding writes at shutdown.
+    """
+
+    def __init__(self):
+        self._pending: Set[asyncio.Task] = set()
+
+    def record(self, collection, user_id: str, project_id: str, model: str, usage: Dict[str, Any],
+               latency_ms: float, at: datetime) -> asyncio.Task:
+        updates = rollup_updates(user_id, project_id, model, usage, latency_ms, at)
+        task = asyncio.create_task(self._write(collection, updates))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+        return task
+
+    async def _write(self, collection, updates: List[UpdateOne]):
+        try:
+            await collection.bulk_write(updates, ordered=False)
+        except Exception as e:
+            logging.error(f"Usage rollup error: {e}")
+
+    async def drain(self):
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+# Write-behind for the chat path (WRITE_BEHIND=1). Message inserts are queued
+# and written with one insert_many per flush; $inc counter updates to the
+# same document are merged and written with one bulk_write. Off by default,
+# in which case every call writes through immediately.
+#
+# Queued writes live in one worker's memory, so read-your-writes only holds
+# when every request reaches that worker: WRITE_BEHIND=1 requires
+# SHARED_STATE_BACKEND=memory and a single worker (see worker_count in
+# shared_state.py; under a process manager set WEB_CONCURRENCY=1).
+WRITE_BEHIND = os.environ.get('WRITE_BEHIND', '0') == '1'
+FLUSH_INTERVAL_SECONDS = float(os.environ.get('WRITE_BEHIND_FLUSH_MS', '50')) / 1000
+MAX_BATCH = 1000
+DEAD_LETTER_SIZE = 100
+COUNTER_CACHE_SIZE = 10000
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+def _aware(at: datetime) -> datetime:
+    return at if at.tzinfo else at.replace(tzinfo=timezone.utc)
+
+
+def _already_inserted(error: dict) -> bool:
+    """A duplicate ``_id`` on a resent batch means an earlier attempt landed it."""
+    if error.get("code") != 11000:
+        return False
+    key_pattern = error.get("keyPattern")
+    if key_pattern is not None:
+        return key_pattern == {"_id": 1}
+    return "index: _id_ " in error.get("errmsg", "")
+
+
+class WriteBehindBuffer:
+    """Batches message inserts and counter updates off the request path.
+
+    Consistency: queued messages stay visible through ``pending`` until
+    their insert has completed, and ``sync(project_id)`` waits until a
+    project's messages are in Mongo, so the same worker's next read sees
+    them. ``stop`` flushes everything before shutdown and raises if
+    anything is still unwritten.
+
+    Every message gets its ``_id`` when queued, so a batch resent after a
+    partial failure is idempotent: duplicate-key errors on ``_id`` mean the
+    document already landed. Documents Mongo rejects for any other reason
+    are logged and kept in ``dead_letters`` instead of blocking the queue.
+    Counter updates that fail are merged back and retried on the next flush.
+    """
+
+    def __init__(self, get_db: Callable[[], Any], enabled: bool = WRITE_BEHIND,
+                 interval: float = FLUSH_INTERVAL_SECONDS, max_batch: int = MAX_BATCH):
+        self.get_db = get_db
+        self.enabled = enabled
+        self.interval = interval
+        self.max_batch = max_batch
+        self._messages: List[Tuple[dict, dict]] = []  # (stored doc, API doc)
+        self._inflight: List[Tuple[dict, dict]] = []
+        self._increments: Dict[tuple, list] = {}
+        self._counters: Dict[str, Tuple[int, datetime]] = {}
+        self.dead_letters: Deque[dict] = deque(maxlen=DEAD_LETTER_SIZE)
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.flushes = 0
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # The loop is asked to finish rather than cancelled, so a batch is
+        # never abandoned halfway through its insert
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            raise RuntimeError(
+                f"Write-behind stopped with {len(self._messages)} messages and "
+                f"{len(self._increments)} counter updates unwritten"
+            ) from e
+
+    async def insert_message(self, stored: dict, api_doc: dict):
+        """Insert ``stored``; ``api_doc`` is what ``pending`` hands back to readers."""
+        if not self.enabled:
+            await self.get_db().messages.insert_one(stored)
+            return
+        stored.setdefault("_id", ObjectId())
+        self._messages.append((stored, api_doc))
+        if len(self._messages) >= self.max_batch:
+            self._wakeup.set()
+
+    def increment(self, collection: str, updates: List[Tuple[dict, dict, dict]]):
+        """Queue ``(filter, $inc, $setOnInsert)`` upserts, merging repeats per flush."""
+        for filter_, inc, on_insert in updates:
+            self._merge((collection, _freeze(filter_)), filter_, inc, on_insert)
+
+    def _merge(self, key: tuple, filter_: dict, inc: dict, on_insert: dict):
+        entry = self._increments.get(key)
+        if entry is None:
+            self._increments[key] = [filter_, dict(inc), on_insert]
+        else:
+            for field, amount in inc.items():
+                entry[1][field] = entry[1].get(field, 0) + amount
+
+    async def incr(self, key: str, amount: int, expires_at: datetime) -> int:
+        """Windowed counter held here and persisted to ``state_counters`` per flush.
+
+        The first use of a key reads the stored value; after that the count
+        is authoritative in this process, which the single-worker requirement
+        makes safe.
+        """
+        entry = self._counters.get(key)
+        if entry is None:
+            doc = await self.get_db().state_counters.find_one({"_id": key})
+            stored = 0
+            if doc and _aware(doc.get("expires_at", expires_at)) > datetime.now(timezone.utc):
+                stored = doc["value"]
+            # Another turn may have seeded the key while we were reading
+            entry = self._counters.setdefault(key, (stored, expires_at))
+        value = entry[0] + amount
+        self._counters[key] = (value, entry[1])
+        if len(self._counters) > COUNTER_CACHE_SIZE:
+            now = datetime.now(timezone.utc)
+            self._counters = {k: v for k, v in self._counters.items() if v[1] > now}
+        self.increment("state_counters", [({"_id": key}, {"value": amount}, {"expires_at": entry[1]})])
+        return value
+
+    def pending(self, project_id: str) -> List[dict]:
+        """Messages for ``project_id`` accepted but not yet confirmed written, oldest first."""
+        return [api for _, api in self._inflight + self._messages if api["project_id"] == project_id]
+
+    async def sync(self, project_id: Optional[str] = None):
+        """Return once ``project_id``'s (or every) queued message is in Mongo."""
+        if not self.enabled:
+            return
+        if project_id is None:
+            if self._messages or self._inflight:
+                await self.flush()
+        elif self.pending(project_id):
+            await self.flush()
+
+    async def flush(self):
+        async with self._flush_lock:
+            self.flushes += 1
+            try:
+                await self._flush_messages()
+            finally:
+                # Counters are independent of messages; a failed insert must not hold them back
+                await self._flush_increments()
+
+    async def _flush_messages(self):
+        while self._messages:
+            self._inflight, self._messages = self._messages[:self.max_batch], self._messages[self.max_batch:]
+            try:
+                await self.get_db().messages.insert_many([stored for stored, _ in self._inflight], ordered=False)
+            except BulkWriteError as e:
+                # Unordered: everything not listed in writeErrors was inserted
+                for error in e.details.get("writeErrors", []):
+                    if not _already_inserted(error):
+                        self._dead_letter(self._inflight[error["index"]][0], error)
+            except Exception as e:
+                # Put the batch back in front; it is retried on the next flush
+                logging.error(f"Write-behind message flush failed: {e}")
+                self._messages = self._inflight + self._messages
+                self._inflight = []
+                raise
+            self._inflight = []
+
+    def _dead_letter(self, stored: dict, error: dict):
+        logging.error(
+            f"Write-behind dropped message {stored.get('id')} in project {stored.get('project_id')}: "
+            f"{error.get('errmsg')}"
+        )
+        self.dead_letters.append({"message": stored, "error": error.get("errmsg"), "code": error.get("code")})
+
+    async def _flush_increments(self):
+        if not self._increments:
+            return
+        batch, self._increments = self._increments, {}
+        by_collection: Dict[str, List[tuple]] = {}
+        for key, entry in batch.items():
+            by_collection.setdefault(key[0], []).append((key, entry))
+        failure = None
+        for collection, entries in by_collection.items():
+            updates = [
+                UpdateOne(filter_, {"$inc": inc, "$setOnInsert": on_insert}, upsert=True)
+                for _, (filter_, inc, on_insert) in entries
+            ]
+            try:
+                await self.get_db()[collection].bulk_write(updates, ordered=False)
+            except BulkWriteError as e:
+                # Unordered: only the updates listed in writeErrors were not applied
+                errors = e.details.get("writeErrors", [])
+                logging.error(f"Write-behind counter flush failed for {len(errors)} updates in {collection}: {e}")
+                for error in errors:
+                    key, entry = entries[error["index"]]
+                    self._merge(key, *entry)
+                failure = failure or e
+            except Exception as e:
+                # Merged back with anything queued since; retried on the next flush
+                logging.error(f"Write-behind counter flush failed for {collection}: {e}")
+                for key, entry in entries:
+                    self._merge(key, *entry)
+                failure = failure or e
+        if failure is not None:
+            raise failure
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                # Already logged; keep the loop alive and retry next interval
+                pass
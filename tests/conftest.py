@@ -0,0 +1,142 @@
+import json
+import os
+import sys
+import types
+from pathlib import Path
+
+import bcrypt
+import httpx
+import pytest
+import pytest_asyncio
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Must be set before server.py is imported; it reads them at import time.
+os.environ.setdefault("MONGO_URL", "mongodb://fake-mongo:27017")
+os.environ.setdefault("DB_NAME", "notfox_test")
+os.environ["SHARED_STATE_BACKEND"] = "memory"
+os.environ["RATE_LIMIT_PROXY_HOPS"] = "0"
+os.environ["JWT_SECRET"] = "test-secret"
+
+import server  # noqa: E402
+import upstream  # noqa: E402
+from coalesce import SingleFlight  # noqa: E402
+from search import InvertedIndex  # noqa: E402
+from shared_state import MemoryBackend  # noqa: E402
+
+from tests.fakes import FakeDatabase, FakeOpenRouter  # noqa: E402
+
+
+class FakeStripe:
+    """Stands in for emergentintegrations' StripeCheckout."""
+
+    sessions = {}
+    payment_status = "unpaid"
+
+    def __init__(self, api_key, webhook_url):
+        self.webhook_url = webhook_url
+
+    async def create_checkout_session(self, request):
+        session_id = f"cs_test_{len(self.sessions) + 1}"
+        self.sessions[session_id] = request
+        return types.SimpleNamespace(session_id=session_id, url=f"https://checkout.stripe.test/{session_id}")
+
+    async def get_checkout_status(self, session_id):
+        request = self.sessions[session_id]
+        return types.SimpleNamespace(
+            status="complete" if self.payment_status == "paid" else "open",
+            payment_status=self.payment_status,
+            amount_total=int(request.amount * 100),
+            currency=request.currency,
+        )
+
+    async def handle_webhook(self, body, signature):
+        return types.SimpleNamespace(**json.loads(body))
+
+
+class FakeCheckoutSessionRequest(types.SimpleNamespace):
+    pass
+
+
+@pytest.fixture
+def stripe(monkeypatch):
+    FakeStripe.sessions = {}
+    FakeStripe.payment_status = "unpaid"
+    checkout = types.ModuleType("emergentintegrations.payments.stripe.checkout")
+    checkout.StripeCheckout = FakeStripe
+    checkout.CheckoutSessionRequest = FakeCheckoutSessionRequest
+    for name in ("emergentintegrations", "emergentintegrations.payments", "emergentintegrations.payments.stripe"):
+        monkeypatch.setitem(sys.modules, name, types.ModuleType(name))
+    monkeypatch.setitem(sys.modules, checkout.__name__, checkout)
+    return FakeStripe
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = FakeDatabase()
+    monkeypatch.setattr(server, "db", db)
+    return db
+
+
+@pytest.fixture
+def openrouter(monkeypatch):
+    fake = FakeOpenRouter()
+    monkeypatch.setattr(upstream, "_client", httpx.AsyncClient(transport=fake.transport))
+    return fake
+
+
+@pytest.fixture(autouse=True)
+def fast_bcrypt(monkeypatch):
+    # Full-cost hashing makes the registration tests take seconds
+    gensalt = bcrypt.gensalt
+    monkeypatch.setattr(server.bcrypt, "gensalt", lambda: gensalt(4))
+
+
+@pytest_asyncio.fixture
+async def app(fake_db, openrouter, stripe, monkeypatch):
+    """Fresh per-test server state, warmed up against the fakes."""
+    monkeypatch.setattr(server.shared_state, "backend", MemoryBackend())
+    server.shared_state.cache.clear()
+    monkeypatch.setattr(server, "read_flights", SingleFlight())
+    monkeypatch.setattr(server, "search_index", InvertedIndex())
+    monkeypatch.setattr(server, "text_search_available", True)
+    monkeypatch.setattr(server, "text_search_retry_at", 0.0)
+    monkeypatch.setattr(server, "upstream_breaker", upstream.CircuitBreaker())
+    monkeypatch.setattr(server, "warmup_state", {"ready": False, "startup_ms": None, "steps": {}})
+    server.rate_limiter.reset()
+
+    await server.warm_up()
+    yield server.app
+    await server.usage_recorder.drain()
+    await server.shared_state.stop()
+    await server.prompt_registry.stop()
+
+
+@pytest_asyncio.fixture
+async def client(app):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+        yield http
+
+
+async def register(client, name="alice"):
+    response = await client.post("/api/auth/register", json={
+        "email": f"{name}@example.com", "password": "hunter22", "username": name
+    })
+    assert response.status_code == 200, response.text
+    body = response.json()
+    return {"Authorization": f"Bearer {body['access_token']}"}, body["user"]
+
+
+@pytest_asyncio.fixture
+async def auth(client):
+    headers, _ = await register(client)
+    return headers
+
+
+@pytest_asyncio.fixture
+async def project(client, auth):
+    response = await client.post("/api/projects", json={"name": "Obby"}, headers=auth)
+    assert response.status_code == 200
+    return response.json()
@@ -0,0 +1,344 @@
+"""In-memory stand-ins for Mongo (via Motor) and the OpenRouter API.
+
+FakeDatabase implements the subset of the Motor API that ``server.py`` uses.
+Every operation yields to the event loop once, like a real round trip, so
+check-then-write races in handlers show up under ``asyncio.gather``.
+"""
+import asyncio
+import copy
+import json
+from datetime import datetime
+from types import SimpleNamespace
+
+import httpx
+from bson import ObjectId
+from bson.binary import Binary
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+
+def _get(doc, field):
+    return doc.get(field)
+
+
+BSON_TYPES = {"string": str, "date": datetime, "binData": (bytes, Binary)}
+# Mongo sorts values of different types by type first, in this order
+SORT_TYPES = [type(None), (int, float), str, dict, list, (bytes, Binary), ObjectId, bool, datetime]
+
+
+def _sort_key(value):
+    if isinstance(value, bool):
+        return (SORT_TYPES.index(bool), value)
+    rank = next(i for i, t in enumerate(SORT_TYPES) if isinstance(value, t))
+    return (rank, value if value is not None else 0)
+
+
+def _compare(value, op, arg):
+    if op == "$type":
+        return isinstance(value, BSON_TYPES[arg]) and not isinstance(value, bool)
+    if op == "$in":
+        return value in arg
+    if op == "$nin":
+        return value not in arg
+    if op == "$exists":
+        return (value is not None) == bool(arg)
+    if op == "$ne":
+        return value != arg
+    if value is None:
+        return False
+    if op == "$gt":
+        return value > arg
+    if op == "$gte":
+        return value >= arg
+    if op == "$lt":
+        return value < arg
+    if op == "$lte":
+        return value <= arg
+    raise NotImplementedError(f"FakeDatabase does not support {op}")
+
+
+def matches(doc, query):
+    for field, condition in query.items():
+        if field == "$text":
+            raise OperationFailure("text index required for $text query", code=27)
+        if field == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+            continue
+        value = _get(doc, field)
+        if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+            if not all(_compare(value, op, arg) for op, arg in condition.items()):
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+def project(doc, projection):
+    doc = copy.deepcopy(doc)
+    if not projection:
+        return doc
+    include = {k for k, v in projection.items() if v and k != "_id"}
+    if include:
+        doc = {k: v for k, v in doc.items() if k in include or k == "_id"}
+    if projection.get("_id", 1) == 0:
+        doc.pop("_id", None)
+    return doc
+
+
+def apply_update(doc, update, inserting):
+    for op, fields in update.items():
+        if op == "$set":
+            doc.update(copy.deepcopy(fields))
+        elif op == "$inc":
+            for field, amount in fields.items():
+                doc[field] = doc.get(field, 0) + amount
+        elif op == "$setOnInsert":
+            if inserting:
+                doc.update(copy.deepcopy(fields))
+        else:
+            raise NotImplementedError(f"FakeDatabase does not support {op}")
+
+
+class FakeCursor:
+    def __init__(self, collection, query, projection):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key, direction=None):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for field, order in keys:
+            if isinstance(order, dict):
+                raise OperationFailure("text index required for $text query", code=27)
+        self._sort = keys
+        return self
+
+    def skip(self, n):
+        self._skip = n
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    def _results(self):
+        docs = [d for d in self._collection.docs if matches(d, self._query)]
+        for field, order in reversed(self._sort):
+            docs.sort(key=lambda d: _sort_key(d.get(field)), reverse=order == -1)
+        docs = docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        return [project(d, self._projection) for d in docs]
+
+    async def to_list(self, length):
+        await asyncio.sleep(0)
+        docs = self._results()
+        return docs if length is None else docs[:length]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._results():
+            await asyncio.sleep(0)
+            yield doc
+
+
+class FakeCollection:
+    def __init__(self, name):
+        self.name = name
+        self.docs = []
+        self.unique = []
+
+    def _check_unique(self, doc, ignore=None):
+        for fields in self.unique:
+            key = tuple(doc.get(f) for f in fields)
+            for other in self.docs:
+                if other is not ignore and tuple(other.get(f) for f in fields) == key:
+                    raise DuplicateKeyError(
+                        f"E11000 duplicate key error collection: {self.name}",
+                        details={"keyPattern": {f: 1 for f in fields}, "keyValue": dict(zip(fields, key))}
+                    )
+
+    def _insert(self, doc):
+        doc.setdefault("_id", ObjectId())
+        stored = copy.deepcopy(doc)
+        self._check_unique(stored)
+        if any(other["_id"] == stored["_id"] for other in self.docs):
+            raise DuplicateKeyError(
+                f"E11000 duplicate key error collection: {self.name} index: _id_ dup key",
+                details={"keyPattern": {"_id": 1}, "keyValue": {"_id": stored["_id"]}}
+            )
+        self.docs.append(stored)
+        return doc["_id"]
+
+    async def create_index(self, keys, unique=False, **kwargs):
+        await asyncio.sleep(0)
+        fields = [keys] if isinstance(keys, str) else [k for k, _ in keys]
+        if unique and fields not in self.unique:
+            seen = set()
+            for doc in self.docs:
+                key = tuple(doc.get(f) for f in fields)
+                if key in seen:
+                    raise DuplicateKeyError(
+                        f"E11000 duplicate key error collection: {self.name} index: {'_'.join(fields)}",
+                        code=11000
+                    )
+                seen.add(key)
+            self.unique.append(fields)
+        return "_".join(fields)
+
+    async def find_one(self, query=None, projection=None):
+        await asyncio.sleep(0)
+        for doc in self.docs:
+            if matches(doc, query or {}):
+                return project(doc, projection)
+        return None
+
+    def find(self, query=None, projection=None):
+        return FakeCursor(self, query or {}, projection)
+
+    def aggregate(self, pipeline):
+        for stage in pipeline:
+            if "$match" in stage and "$text" in stage["$match"]:
+                raise OperationFailure("text index required for $text query", code=27)
+        raise NotImplementedError("FakeDatabase only fails $text aggregations")
+
+    async def count_documents(self, query):
+        await asyncio.sleep(0)
+        return sum(1 for d in self.docs if matches(d, query))
+
+    async def insert_one(self, doc):
+        await asyncio.sleep(0)
+        return SimpleNamespace(inserted_id=self._insert(doc))
+
+    async def insert_many(self, docs, ordered=True):
+        await asyncio.sleep(0)
+        inserted, errors = [], []
+        for i, doc in enumerate(docs):
+            try:
+                inserted.append(self._insert(doc))
+            except DuplicateKeyError as e:
+                errors.append(dict(e.details, index=i, code=11000, errmsg=str(e)))
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(inserted)})
+        return SimpleNamespace(inserted_ids=inserted)
+
+    async def _update(self, query, update, upsert, many):
+        matched = [d for d in self.docs if matches(d, query)]
+        if not many:
+            matched = matched[:1]
+        for doc in matched:
+            apply_update(doc, update, inserting=False)
+        upserted_id = None
+        if not matched and upsert:
+            doc = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+            apply_update(doc, update, inserting=True)
+            upserted_id = self._insert(doc)
+        return SimpleNamespace(matched_count=len(matched), modified_count=len(matched), upserted_id=upserted_id)
+
+    async def update_one(self, query, update, upsert=False):
+        await asyncio.sleep(0)
+        return await self._update(query, update, upsert, many=False)
+
+    async def update_many(self, query, update, upsert=False):
+        await asyncio.sleep(0)
+        return await self._update(query, update, upsert, many=True)
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=ReturnDocument.BEFORE,
+                                  projection=None):
+        await asyncio.sleep(0)
+        before = next((copy.deepcopy(d) for d in self.docs if matches(d, query)), None)
+        await self._update(query, update, upsert, many=False)
+        if return_document == ReturnDocument.AFTER:
+            return next((project(d, projection) for d in self.docs if matches(d, query)), None)
+        return before
+
+    async def bulk_write(self, requests, ordered=True):
+        await asyncio.sleep(0)
+        for request in requests:
+            document = request._doc
+            if "$set" in document or "$inc" in document or "$setOnInsert" in document:
+                await self._update(request._filter, document, request._upsert, many=False)
+            else:
+                for i, existing in enumerate(self.docs):
+                    if matches(existing, request._filter):
+                        self.docs[i] = dict(copy.deepcopy(document), _id=existing["_id"])
+                        break
+        return SimpleNamespace(acknowledged=True)
+
+    async def delete_one(self, query):
+        await asyncio.sleep(0)
+        for i, doc in enumerate(self.docs):
+            if matches(doc, query):
+                del self.docs[i]
+                return SimpleNamespace(deleted_count=1)
+        return SimpleNamespace(deleted_count=0)
+
+    async def delete_many(self, query):
+        await asyncio.sleep(0)
+        before = len(self.docs)
+        self.docs = [d for d in self.docs if not matches(d, query)]
+        return SimpleNamespace(deleted_count=before - len(self.docs))
+
+
+class FakeDatabase:
+    def __init__(self):
+        self._collections = {}
+        self.down = False
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(name)
+        return self._collections[name]
+
+    async def command(self, name, *args, **kwargs):
+        await asyncio.sleep(0)
+        if self.down:
+            raise ConnectionError("fake mongo is down")
+        if name == "ping":
+            return {"ok": 1.0}
+        raise NotImplementedError(f"FakeDatabase does not support command {name}")
+
+
+class FakeOpenRouter:
+    """httpx transport standing in for the OpenRouter completions API."""
+
+    def __init__(self):
+        self.requests = []
+        self.status_code = 200
+        self.reply = "```lua\nprint('hello')\n```"
+        self.usage = {"prompt_tokens": 120, "completion_tokens": 30, "total_tokens": 150, "cost": 0.0004}
+        self.delay = 0.0
+        self.transport = httpx.MockTransport(self.handle)
+
+    async def handle(self, request):
+        if request.method == "HEAD":
+            return httpx.Response(200)
+        body = json.loads(request.content)
+        self.requests.append(body)
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.status_code != 200:
+            return httpx.Response(self.status_code, text="upstream exploded")
+        return httpx.Response(200, json={
+            "id": "gen-1",
+            "model": body["model"],
+            "created": int(datetime.now().timestamp()),
+            "choices": [{"message": {"role": "assistant", "content": self.reply}}],
+            "usage": self.usage,
+        })
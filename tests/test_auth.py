@@ -0,0 +1,53 @@
+from tests.conftest import register
+
+
+async def test_register_login_and_me(client):
+    headers, user = await register(client)
+    assert user["username"] == "alice"
+    assert user["subscription_tier"] == "free"
+
+    response = await client.post("/api/auth/login", json={"email": "alice@example.com", "password": "hunter22"})
+    assert response.status_code == 200
+    assert response.json()["user"]["id"] == user["id"]
+
+    response = await client.get("/api/auth/me", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["email"] == "alice@example.com"
+
+
+async def test_login_rejects_wrong_password(client):
+    await register(client)
+    response = await client.post("/api/auth/login", json={"email": "alice@example.com", "password": "nope"})
+    assert response.status_code == 401
+
+
+async def test_duplicate_email_and_username(client):
+    await register(client)
+    response = await client.post("/api/auth/register", json={
+        "email": "alice@example.com", "password": "x", "username": "other"
+    })
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Email already registered"
+
+    response = await client.post("/api/auth/register", json={
+        "email": "other@example.com", "password": "x", "username": "alice"
+    })
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Username already taken"
+
+
+async def test_missing_and_invalid_tokens(client):
+    assert (await client.get("/api/auth/me")).status_code == 401
+    response = await client.get("/api/auth/me", headers={"Authorization": "Bearer not-a-jwt"})
+    assert response.status_code == 401
+
+
+async def test_theme_update_invalidates_cached_user(client, auth):
+    assert (await client.get("/api/auth/me", headers=auth)).json()["theme"] == "dark"
+
+    response = await client.put("/api/auth/theme", json={"theme": "light"}, headers=auth)
+    assert response.status_code == 200
+    assert (await client.get("/api/auth/me", headers=auth)).json()["theme"] == "light"
+
+    response = await client.put("/api/auth/theme", json={"theme": "neon"}, headers=auth)
+    assert response.status_code == 400
@@ -0,0 +1,71 @@
+import asyncio
+
+import server
+
+
+async def chat(client, auth, project, message="make a sword"):
+    return await client.post("/api/chat", json={"project_id": project["id"], "message": message}, headers=auth)
+
+
+async def test_chat_stores_both_turns_and_usage(client, auth, project, openrouter, fake_db):
+    response = await chat(client, auth, project)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["user_message"]["content"] == "make a sword"
+    assert body["ai_message"]["content"] == openrouter.reply
+
+    sent = openrouter.requests[0]["messages"]
+    assert sent[0]["role"] == "system"
+    assert sent[-1] == {"role": "user", "content": "make a sword"}
+
+    messages = (await client.get(f"/api/messages/{project['id']}", headers=auth)).json()
+    assert [m["role"] for m in messages] == ["user", "assistant"]
+
+    await server.usage_recorder.drain()
+    usage = (await client.get("/api/usage", headers=auth)).json()
+    assert usage["totals"]["turns"] == 1
+    assert usage["totals"]["prompt_tokens"] == 120
+    assert list(usage["by_model"]) == [server.ChatRequest.model_fields["model"].default]
+
+
+async def test_chat_unknown_project(client, auth):
+    response = await client.post("/api/chat", json={"project_id": "missing", "message": "hi"}, headers=auth)
+    assert response.status_code == 404
+
+
+async def test_upstream_failure_returns_quota_slot(client, auth, project, openrouter):
+    openrouter.status_code = 502
+    for _ in range(server.FREE_DAILY_CHAT_LIMIT + 2):
+        assert (await chat(client, auth, project)).status_code in (500, 503)
+
+    openrouter.status_code = 200
+    server.upstream_breaker.record_success()
+    assert (await chat(client, auth, project)).status_code == 200
+
+
+async def test_breaker_opens_after_repeated_upstream_errors(client, auth, project, openrouter):
+    openrouter.status_code = 503
+    for _ in range(server.upstream_breaker.failure_threshold):
+        assert (await chat(client, auth, project)).status_code == 500
+    assert (await chat(client, auth, project)).status_code == 503
+    assert len(openrouter.requests) == server.upstream_breaker.failure_threshold
+
+    ready = (await client.get("/api/health/ready")).json()
+    assert ready["checks"]["upstream"]["state"] == "open"
+
+
+async def test_concurrent_chats_respect_free_quota(client, auth, project, openrouter):
+    openrouter.delay = 0.01
+    burst = server.FREE_DAILY_CHAT_LIMIT + 5
+    responses = await asyncio.gather(*(chat(client, auth, project, f"msg {i}") for i in range(burst)))
+    codes = sorted(r.status_code for r in responses)
+    assert codes.count(200) == server.FREE_DAILY_CHAT_LIMIT
+    assert codes.count(429) == burst - server.FREE_DAILY_CHAT_LIMIT
+    assert len(openrouter.requests) == server.FREE_DAILY_CHAT_LIMIT
+
+
+async def test_premium_users_are_not_capped(client, auth, project, fake_db):
+    fake_db.users.docs[0]["subscription_tier"] = "premium"
+    server.shared_state.cache.clear()
+    for _ in range(server.FREE_DAILY_CHAT_LIMIT + 1):
+        assert (await chat(client, auth, project)).status_code == 200
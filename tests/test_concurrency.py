@@ -0,0 +1,97 @@
+import asyncio
+
+import server
+from shared_state import MemoryBackend, MongoBackend, SharedState
+from tests.fakes import FakeDatabase
+
+
+async def test_concurrent_registration_creates_one_user(client, fake_db):
+    payload = {"email": "race@example.com", "password": "hunter22", "username": "racer"}
+    responses = await asyncio.gather(*(client.post("/api/auth/register", json=payload) for _ in range(10)))
+    codes = [r.status_code for r in responses]
+    assert codes.count(200) == 1
+    assert codes.count(400) == 9
+    assert len(fake_db.users.docs) == 1
+
+
+async def test_concurrent_registration_same_username(client, fake_db):
+    responses = await asyncio.gather(*(
+        client.post("/api/auth/register", json={
+            "email": f"u{i}@example.com", "password": "hunter22", "username": "taken"
+        })
+        for i in range(5)
+    ))
+    assert [r.status_code for r in responses].count(200) == 1
+    assert {r.json()["detail"] for r in responses if r.status_code == 400} == {"Username already taken"}
+
+
+async def test_identical_reads_are_coalesced(client, auth, project):
+    flights = server.read_flights
+    started = flights.started
+    responses = await asyncio.gather(*(
+        client.get(f"/api/messages/{project['id']}", headers=auth) for _ in range(20)
+    ))
+    assert all(r.status_code == 200 for r in responses)
+    assert flights.started - started < 20
+    assert flights.joined > 0
+
+
+async def test_reads_after_write_see_the_write(client, auth, project):
+    before = client.get(f"/api/messages/{project['id']}", headers=auth)
+    write = client.post("/api/chat", json={"project_id": project["id"], "message": "hello"}, headers=auth)
+    await asyncio.gather(before, write)
+    after = (await client.get(f"/api/messages/{project['id']}", headers=auth)).json()
+    assert [m["content"] for m in after][0] == "hello"
+
+
+async def test_quota_counter_shared_between_workers():
+    db = FakeDatabase()
+    workers = [SharedState(MongoBackend(db)) for _ in range(3)]
+    results = await asyncio.gather(*(w.incr("chat_quota:u1:2025-01-01") for w in workers for _ in range(5)))
+    assert sorted(results) == list(range(1, 16))
+
+
+async def test_invalidation_reaches_other_workers():
+    db = FakeDatabase()
+    a, b = SharedState(MongoBackend(db)), SharedState(MongoBackend(db))
+    await a.start()
+    await b.start()
+
+    async def load():
+        return {"theme": "dark"}
+
+    try:
+        await b.cached("user:1", 60, load)
+        await a.invalidate("user:1")
+        assert b.cache.get("user:1") is not None
+        await b.backend.poll_once()
+        assert b.cache.get("user:1") is None
+    finally:
+        await a.stop()
+        await b.stop()
+
+
+async def test_load_overlapping_invalidation_is_not_cached():
+    state = SharedState(MemoryBackend())
+    user = {"subscription_tier": "free"}
+    loaded = asyncio.Event()
+    release = asyncio.Event()
+
+    async def slow_load():
+        snapshot = dict(user)
+        loaded.set()
+        await release.wait()
+        return snapshot
+
+    stale_read = asyncio.create_task(state.cached("user:1", 60, slow_load))
+    await loaded.wait()
+    user["subscription_tier"] = "premium"
+    await state.invalidate("user:1")
+    release.set()
+    assert (await stale_read)["subscription_tier"] == "free"
+
+    async def load():
+        return dict(user)
+
+    assert (await state.cached("user:1", 60, load))["subscription_tier"] == "premium"
+    assert state._loading == {}
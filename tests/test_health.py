@@ -0,0 +1,45 @@
+import pytest
+
+import server
+from tests.fakes import FakeDatabase
+
+
+async def test_liveness(client):
+    assert (await client.get("/api/health")).json() == {"status": "healthy"}
+    assert (await client.get("/api/health/live")).status_code == 200
+
+
+async def test_readiness_after_warm_up(client):
+    response = await client.get("/api/health/ready")
+    assert response.status_code == 200
+    checks = response.json()["checks"]
+    assert checks["mongo"]["ok"]
+    assert checks["warmup"]["ready"]
+    assert checks["upstream"]["state"] == "closed"
+
+
+async def test_not_ready_when_mongo_down(client, fake_db):
+    fake_db.down = True
+    response = await client.get("/api/health/ready")
+    assert response.status_code == 503
+    assert response.json()["checks"]["mongo"]["ok"] is False
+
+
+async def test_not_ready_before_warm_up(client, monkeypatch):
+    monkeypatch.setitem(server.warmup_state, "ready", False)
+    assert (await client.get("/api/health/ready")).status_code == 503
+
+
+async def test_duplicate_users_do_not_block_other_indexes(monkeypatch, caplog):
+    db = FakeDatabase()
+    db.users.docs = [
+        {"_id": 1, "email": "twin@example.com", "username": "twin"},
+        {"_id": 2, "email": "twin@example.com", "username": "twin2"},
+    ]
+    monkeypatch.setattr(server, "db", db)
+
+    with pytest.raises(RuntimeError, match="users.email"):
+        await server.create_indexes()
+    assert db.users.unique == [["username"]]
+    assert db.usage_rollups.unique
+    assert any(r.levelname == "CRITICAL" and "duplicate users" in r.message for r in caplog.records)
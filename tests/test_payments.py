@@ -0,0 +1,38 @@
+import json
+
+
+async def test_plans_are_public(client):
+    plans = (await client.get("/api/subscription/plans")).json()
+    assert set(plans) == {"weekly", "monthly", "yearly"}
+
+
+async def test_checkout_rejects_unknown_plan(client, auth):
+    response = await client.post("/api/payments/checkout", json={"plan": "lifetime", "origin_url": "https://x"},
+                                 headers=auth)
+    assert response.status_code == 400
+
+
+async def test_checkout_then_paid_status_upgrades_user(client, auth, stripe, fake_db):
+    response = await client.post("/api/payments/checkout", json={"plan": "monthly", "origin_url": "https://app"},
+                                 headers=auth)
+    assert response.status_code == 200
+    session_id = response.json()["session_id"]
+    assert fake_db.payment_transactions.docs[0]["payment_status"] == "initiated"
+
+    status = (await client.get(f"/api/payments/status/{session_id}", headers=auth)).json()
+    assert status["payment_status"] == "unpaid"
+    assert (await client.get("/api/auth/me", headers=auth)).json()["subscription_tier"] == "free"
+
+    stripe.payment_status = "paid"
+    status = (await client.get(f"/api/payments/status/{session_id}", headers=auth)).json()
+    assert status == {"status": "complete", "payment_status": "paid", "amount_total": 14.99, "currency": "usd"}
+    assert fake_db.payment_transactions.docs[0]["payment_status"] == "paid"
+    assert (await client.get("/api/auth/me", headers=auth)).json()["subscription_tier"] == "premium"
+
+
+async def test_webhook_upgrades_user(client, auth, fake_db):
+    user = (await client.get("/api/auth/me", headers=auth)).json()
+    event = {"payment_status": "paid", "session_id": "cs_1", "metadata": {"user_id": user["id"]}}
+    response = await client.post("/api/webhook/stripe", content=json.dumps(event))
+    assert response.json() == {"received": True}
+    assert (await client.get("/api/auth/me", headers=auth)).json()["subscription_tier"] == "premium"
@@ -0,0 +1,70 @@
+import asyncio
+import time
+from collections import Counter
+
+import server
+from profiling import collapsed, speedscope
+
+from tests.conftest import register
+
+
+async def admin(client, monkeypatch):
+    monkeypatch.setattr(server, "ADMIN_EMAILS", {"root@example.com"})
+    headers, _ = await register(client, "root")
+    return headers
+
+
+def block_loop():
+    time.sleep(0.25)
+
+
+async def test_profile_requires_admin(client, auth):
+    response = await client.post("/api/admin/profile", params={"seconds": 0.05}, headers=auth)
+    assert response.status_code == 403
+
+
+async def test_profile_reports_blocking_callback(client, monkeypatch):
+    headers = await admin(client, monkeypatch)
+    loop = asyncio.get_running_loop()
+    loop.call_later(0.1, block_loop)
+
+    response = await client.post("/api/admin/profile", params={"seconds": 0.6}, headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["sample_count"] > 0
+    assert body["profile"]["profiles"][0]["type"] == "sampled"
+
+    lag = body["loop_lag"]
+    assert lag["max_ms"] >= 200
+    worst = lag["blocked"][0]
+    assert worst["duration_ms"] >= 200
+    assert any(frame.startswith("block_loop ") for frame in worst["stack"])
+
+
+async def test_collapsed_format(client, monkeypatch):
+    headers = await admin(client, monkeypatch)
+    response = await client.post("/api/admin/profile", params={"seconds": 0.05, "format": "collapsed"},
+                                 headers=headers)
+    assert response.status_code == 200
+    lines = response.json()["profile"].splitlines()
+    assert lines and all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+
+async def test_one_profile_at_a_time(client, monkeypatch):
+    headers = await admin(client, monkeypatch)
+    first = asyncio.create_task(client.post("/api/admin/profile", params={"seconds": 0.2}, headers=headers))
+    await asyncio.sleep(0.05)
+    second = await client.post("/api/admin/profile", params={"seconds": 0.05}, headers=headers)
+    assert second.status_code == 409
+    assert (await first).status_code == 200
+
+
+def test_formats_share_stacks():
+    frame_a, frame_b = ("main", "app.py", 1), ("work", "app.py", 10)
+    samples = Counter({(frame_a, frame_b): 3, (frame_a,): 1})
+
+    assert collapsed(samples) == "main (app.py:1);work (app.py:10) 3\nmain (app.py:1) 1\n"
+    profile = speedscope(samples, interval_ms=5.0)
+    assert [f["name"] for f in profile["shared"]["frames"]] == ["main", "work"]
+    assert profile["profiles"][0]["samples"] == [[0, 1], [0]]
+    assert profile["profiles"][0]["weights"] == [15.0, 5.0]
@@ -0,0 +1,148 @@
+import json
+
+import pytest
+from pymongo.errors import OperationFailure
+from starlette.requests import ClientDisconnect
+
+import server
+from search import InvertedIndex
+from tests.conftest import register
+
+
+async def test_project_crud(client, auth):
+    response = await client.post("/api/projects", json={"name": "Tycoon"}, headers=auth)
+    assert response.status_code == 200
+    project = response.json()
+    assert project["project_type"] == "roblox_game"
+
+    listing = (await client.get("/api/projects", headers=auth)).json()
+    assert [p["id"] for p in listing] == [project["id"]]
+    assert (await client.get(f"/api/projects/{project['id']}", headers=auth)).json()["name"] == "Tycoon"
+
+    assert (await client.delete(f"/api/projects/{project['id']}", headers=auth)).status_code == 200
+    assert (await client.get("/api/projects", headers=auth)).json() == []
+    assert (await client.get(f"/api/projects/{project['id']}", headers=auth)).status_code == 404
+
+
+async def test_projects_are_scoped_to_owner(client, auth, project):
+    bob, _ = await register(client, "bob")
+    assert (await client.get(f"/api/projects/{project['id']}", headers=bob)).status_code == 404
+    assert (await client.get(f"/api/messages/{project['id']}", headers=bob)).status_code == 404
+    assert (await client.delete(f"/api/projects/{project['id']}", headers=bob)).status_code == 404
+    assert (await client.get("/api/projects", headers=bob)).json() == []
+
+
+async def test_export_then_import_round_trip(client, auth, project, openrouter):
+    for text in ("make a door", "make it open"):
+        response = await client.post("/api/chat", json={"project_id": project["id"], "message": text}, headers=auth)
+        assert response.status_code == 200
+
+    response = await client.get(f"/api/projects/{project['id']}/export", headers=auth)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[0]["type"] == "project"
+    assert len(lines) == 5
+    assert [(line["message"]["role"], line["message"]["content"]) for line in lines[1:]] == [
+        ("user", "make a door"), ("assistant", openrouter.reply),
+        ("user", "make it open"), ("assistant", openrouter.reply),
+    ]
+
+    response = await client.post("/api/projects/import", content=response.content, headers=auth)
+    assert response.status_code == 200, response.text
+    imported = response.json()
+    assert imported["messages_imported"] == 4
+    assert imported["project"]["id"] != project["id"]
+
+    original = (await client.get(f"/api/messages/{project['id']}", headers=auth)).json()
+    copied = (await client.get(f"/api/messages/{imported['project']['id']}", headers=auth)).json()
+    assert [(m["role"], m["content"]) for m in copied] == [(m["role"], m["content"]) for m in original]
+    assert not {m["id"] for m in copied} & {m["id"] for m in original}
+
+
+async def test_import_rejects_bad_archive_and_rolls_back(client, auth, fake_db):
+    archive = (
+        b'{"type": "project", "version": 1, "project": {"name": "Broken"}}\n'
+        b'{"type": "message", "message": {"role": "user", "content": "hi", "created_at": "2025-01-01T00:00:00+00:00"}}\n'
+        b'{"type": "message", "message": {"role": "wizard", "content": "hi", "created_at": "2025-01-01T00:00:00+00:00"}}\n'
+    )
+    response = await client.post("/api/projects/import", content=archive, headers=auth)
+    assert response.status_code == 400
+    assert "line 3" in response.json()["detail"]
+    assert fake_db.projects.docs == []
+    assert fake_db.messages.docs == []
+
+
+async def test_search_uses_fallback_index(client, auth, project):
+    await client.post("/api/chat", json={"project_id": project["id"], "message": "leaderstats coins"}, headers=auth)
+    response = await client.get("/api/search", params={"q": "leaderstats"}, headers=auth)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["backend"] == "memory"
+    assert [hit["type"] for hit in body["results"]] == ["message"]
+    hit = body["results"][0]
+    start, end = hit["highlights"][0]
+    assert hit["snippet"][start:end] == "leaderstats"
+
+    response = await client.get("/api/search", params={"q": "obby"}, headers=auth)
+    assert [hit["type"] for hit in response.json()["results"]] == ["project"]
+
+
+async def test_import_rolled_back_when_client_disconnects(app, client, auth, fake_db):
+    message = json.dumps({"type": "message", "message": {
+        "role": "user", "content": "hi", "created_at": "2025-01-01T00:00:00+00:00"
+    }})
+    body = ('{"type": "project", "version": 1, "project": {"name": "Huge"}}\n' + (message + "\n") * 1500).encode()
+    seen_while_importing = []
+
+    async def receive():
+        if not seen_while_importing:
+            seen_while_importing.append(len(fake_db.projects.docs))
+            return {"type": "http.request", "body": body, "more_body": True}
+        # The first batch is in Mongo by the time the upload drops
+        seen_while_importing.append(len(fake_db.messages.docs))
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        pass
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": "/api/projects/import", "raw_path": b"/api/projects/import",
+        "root_path": "", "query_string": b"", "server": ("test", 80), "client": ("127.0.0.1", 5000),
+        "headers": [(b"authorization", auth["Authorization"].encode()), (b"content-type", b"application/x-ndjson")],
+    }
+    with pytest.raises(ClientDisconnect):
+        await app(scope, receive, send)
+
+    assert seen_while_importing == [0, 1000]
+    assert fake_db.projects.docs == []
+    assert fake_db.messages.docs == []
+    assert (await client.get("/api/projects", headers=auth)).json() == []
+
+
+async def test_transient_text_search_error_does_not_switch_backend(client, auth, project, monkeypatch):
+    async def interrupted(*args):
+        raise OperationFailure("operation was interrupted", code=11601)
+
+    monkeypatch.setattr(server, "text_search", interrupted)
+    response = await client.get("/api/search", params={"q": "obby"}, headers=auth)
+    assert response.status_code == 503
+    assert server.text_search_available
+    assert not server.search_index.is_loaded(project["user_id"])
+
+
+def test_memory_index_evicts_least_recently_searched_users():
+    index = InvertedIndex(budget_chars=100)
+    messages = lambda user: [{"id": f"{user}-{i}", "project_id": "p", "content": "x" * 20} for i in range(2)]
+    index.load_user("a", [], messages("a"))
+    index.load_user("b", [], messages("b"))
+    index.search("a", "x", 0, 1)
+    index.load_user("c", [], messages("c"))
+
+    assert [index.is_loaded(u) for u in "abc"] == [True, False, True]
+    assert index.chars == 80
+
+    index.add_message("c", {"id": "c-big", "project_id": "p", "content": "y" * 50})
+    assert [index.is_loaded(u) for u in "abc"] == [False, False, True]
+    assert index.chars == 90
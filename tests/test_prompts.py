@@ -0,0 +1,116 @@
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import prompts
+import server
+from prompts import PromptRegistry, build_messages, history_skip
+from storage import encode_message
+
+
+def write_templates(path, templates):
+    path.write_text(json.dumps({"templates": templates}))
+
+
+def test_lookup_falls_back_to_default(tmp_path):
+    registry = PromptRegistry(tmp_path / "missing.json")
+    registry.reload()
+    template = registry.get("roblox_game", "any/model")
+    assert template.system.startswith("You are NotFox AI")
+    assert template.token_count > 0
+    assert registry.get("roblox_ui", "other") is template
+
+
+def test_get_before_load_serves_defaults_without_io(tmp_path, monkeypatch):
+    path = tmp_path / "templates.json"
+    write_templates(path, [{"project_type": "roblox_ui", "system": "UI expert"}])
+    registry = PromptRegistry(path)
+
+    def no_tokenizer(text):
+        raise AssertionError("token counting on the request path")
+
+    monkeypatch.setattr(prompts, "count_tokens", no_tokenizer)
+    template = registry.get("roblox_ui", "m")
+    assert template.system.startswith("You are NotFox AI")
+    assert template.token_count > 0
+    assert registry._mtime is None and not registry.templates
+
+
+def test_lookup_order_and_hot_reload(tmp_path):
+    path = tmp_path / "templates.json"
+    write_templates(path, [
+        {"project_type": "roblox_ui", "system": "UI expert"},
+        {"project_type": "roblox_ui", "model": "m1", "system": "UI expert on m1"},
+    ])
+    registry = PromptRegistry(path)
+    registry.check()
+    assert registry.get("roblox_ui", "m1").system == "UI expert on m1"
+    assert registry.get("roblox_ui", "m2").system == "UI expert"
+
+    write_templates(path, [{"project_type": "roblox_ui", "system": "UI wizard"}])
+    assert registry.get("roblox_ui", "m1").system == "UI expert on m1"
+    registry._mtime = None  # the rewrite can land within the same mtime tick
+    registry.check()
+    assert registry.get("roblox_ui", "m1").system == "UI wizard"
+
+
+def test_invalid_override_keeps_previous_templates(tmp_path):
+    path = tmp_path / "templates.json"
+    write_templates(path, [{"project_type": "roblox_ui", "system": "UI expert"}])
+    registry = PromptRegistry(path)
+    registry.reload()
+
+    path.write_text("{not json")
+    registry._mtime = None
+    registry.check()
+    assert registry.get("roblox_ui", "m").system == "UI expert"
+
+
+def test_history_window_moves_in_steps():
+    assert history_skip(50) == 0
+    assert [history_skip(n) for n in (51, 55, 60, 61)] == [10, 10, 10, 20]
+    for total in range(1, 200):
+        assert total - history_skip(total) <= 50
+
+
+def test_prefix_is_stable_between_turns(tmp_path):
+    template = PromptRegistry(tmp_path / "none.json").get("roblox_game", "m")
+    history = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"turn {i}"} for i in range(30)]
+    first = build_messages(template, history[:20])
+    second = build_messages(template, history)
+    assert second[:len(first)] == first
+    assert first[0] is template.system_message
+
+
+def test_token_budget_drops_whole_blocks(tmp_path):
+    template = PromptRegistry(tmp_path / "none.json").get("roblox_game", "m")
+    history = [{"role": "user", "content": "x" * 400} for _ in range(25)]
+    messages = build_messages(template, history, max_tokens=template.token_count + 1000, step=10)
+    assert len(messages) == 1 + 5
+
+
+async def test_chat_uses_project_type_template(client, auth, openrouter, tmp_path, monkeypatch):
+    path = tmp_path / "templates.json"
+    write_templates(path, [{"project_type": "roblox_plugin", "system": "Plugin expert"}])
+    registry = PromptRegistry(path)
+    registry.reload()
+    monkeypatch.setattr(server, "prompt_registry", registry)
+
+    project = (await client.post("/api/projects", json={"name": "Tool", "project_type": "roblox_plugin"},
+                                 headers=auth)).json()
+    await client.post("/api/chat", json={"project_id": project["id"], "message": "hi"}, headers=auth)
+    assert openrouter.requests[-1]["messages"][0] == {"role": "system", "content": "Plugin expert"}
+
+
+async def test_chat_history_window_starts_on_a_step(client, auth, project, openrouter, fake_db):
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    for i in range(63):
+        await fake_db.messages.insert_one(encode_message({
+            "id": str(uuid.uuid4()), "project_id": project["id"], "role": "user" if i % 2 == 0 else "assistant",
+            "content": f"turn {i}", "created_at": (start + timedelta(minutes=i)).isoformat(),
+        }))
+    await client.post("/api/chat", json={"project_id": project["id"], "message": "turn 63"}, headers=auth)
+
+    # 64 messages: the window skips the oldest 20, a multiple of the step
+    sent = openrouter.requests[-1]["messages"]
+    assert [m["content"] for m in sent[1:]] == [f"turn {i}" for i in range(20, 64)]
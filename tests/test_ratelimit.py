@@ -0,0 +1,146 @@
+import asyncio
+import logging
+
+import jwt
+
+import ratelimit
+import server
+import shared_state
+from ratelimit import RateLimiter, RateLimitMiddleware, client_ip, route_group
+from shared_state import MongoBackend, SharedState, worker_count
+from tests.fakes import FakeDatabase
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_route_groups():
+    assert route_group("POST", "/api/auth/login") == "auth"
+    assert route_group("POST", "/api/chat") == "chat"
+    assert route_group("GET", "/api/payments/status/cs_1") == "payments"
+    assert route_group("GET", "/api/projects") == "read"
+    assert route_group("DELETE", "/api/projects/p1") == "write"
+    assert route_group("GET", "/api/health/ready") is None
+    assert route_group("POST", "/api/webhook/stripe") is None
+    assert route_group("OPTIONS", "/api/chat") is None
+
+
+def test_bucket_refills_over_time():
+    clock = Clock()
+    limiter = RateLimiter(limits={"chat": {"ip": (2, 0.5)}}, clock=clock)
+    assert limiter.check("chat", "1.1.1.1", None) == 0
+    assert limiter.check("chat", "1.1.1.1", None) == 0
+    assert limiter.check("chat", "1.1.1.1", None) == 2.0
+    assert limiter.check("chat", "2.2.2.2", None) == 0
+
+    clock.now += 2
+    assert limiter.check("chat", "1.1.1.1", None) == 0
+    assert limiter.check("chat", "1.1.1.1", None) > 0
+
+
+def test_user_bucket_is_shared_across_ips():
+    limiter = RateLimiter(limits={"chat": {"ip": (100, 1), "user": (2, 0.01)}}, clock=Clock())
+    assert limiter.check("chat", "1.1.1.1", "u1") == 0
+    assert limiter.check("chat", "2.2.2.2", "u1") == 0
+    assert limiter.check("chat", "3.3.3.3", "u1") > 0
+    assert limiter.check("chat", "3.3.3.3", "u2") == 0
+
+
+def test_idle_buckets_are_evicted():
+    clock = Clock()
+    limiter = RateLimiter(limits={"read": {"ip": (10, 1)}}, clock=clock)
+    for i in range(50):
+        limiter.check("read", f"10.0.0.{i}", None)
+    clock.now += 3600
+    limiter.check("read", "10.0.1.1", None)
+    limiter.sweep(clock())
+    assert list(limiter.buckets) == [("read", "ip", "10.0.1.1")]
+
+
+async def test_login_burst_gets_429_with_retry_after(client, monkeypatch):
+    monkeypatch.setitem(server.rate_limiter.limits, "auth", {"ip": (3, 0.1)})
+    payload = {"email": "nobody@example.com", "password": "x"}
+    responses = await asyncio.gather(*(client.post("/api/auth/login", json=payload) for _ in range(5)))
+    codes = sorted(r.status_code for r in responses)
+    assert codes == [401, 401, 401, 429, 429]
+    limited = next(r for r in responses if r.status_code == 429)
+    assert int(limited.headers["retry-after"]) >= 1
+
+
+async def test_forwarded_for_is_ignored_without_trusted_proxy(client, monkeypatch):
+    monkeypatch.setitem(server.rate_limiter.limits, "auth", {"ip": (2, 0.01)})
+    payload = {"email": "nobody@example.com", "password": "x"}
+    codes = [
+        (await client.post("/api/auth/login", json=payload, headers={"X-Forwarded-For": f"203.0.113.{i}"})).status_code
+        for i in range(3)
+    ]
+    assert codes == [401, 401, 429]
+
+
+async def test_forwarded_for_separates_clients_behind_proxy(client, monkeypatch):
+    monkeypatch.setattr(ratelimit, "PROXY_HOPS", 1)
+    monkeypatch.setitem(server.rate_limiter.limits, "read", {"ip": (1, 0.01)})
+    first = {"X-Forwarded-For": "203.0.113.1"}
+    assert (await client.get("/api/subscription/plans", headers=first)).status_code == 200
+    assert (await client.get("/api/subscription/plans", headers=first)).status_code == 429
+    other = {"X-Forwarded-For": "203.0.113.2"}
+    assert (await client.get("/api/subscription/plans", headers=other)).status_code == 200
+
+
+async def test_shared_window_limits_across_workers():
+    shared = SharedState(MongoBackend(FakeDatabase()))
+    limits = {"auth": {"ip": (4, 4 / 60)}, "read": {"ip": (4, 4 / 60)}}
+    workers = [RateLimiter(limits=limits, clock=Clock(), shared=shared, shared_groups="auth",
+                           wall_clock=lambda: 60.0)
+               for _ in range(3)]
+
+    allowed = 0
+    for i in range(12):
+        limiter = workers[i % 3]
+        if not limiter.check("auth", "1.1.1.1", None) and not await limiter.check_shared("auth", "1.1.1.1", None):
+            allowed += 1
+    assert allowed == 4
+    assert await workers[0].check_shared("auth", "1.1.1.1", None) == 60.0
+    assert not workers[0].is_shared("read")
+
+
+async def test_shared_counting_skips_cheap_routes_and_batches_scopes():
+    db = FakeDatabase()
+    limiter = RateLimiter(jwt_secret="s", shared=SharedState(MongoBackend(db)))
+    middleware = RateLimitMiddleware(lambda scope, receive, send: asyncio.sleep(0), limiter)
+    token = b"Bearer " + jwt.encode({"user_id": "u1"}, "s", algorithm="HS256").encode()
+
+    def scope(method, path):
+        return {"type": "http", "method": method, "path": path, "client": ("1.1.1.1", 5000),
+                "headers": [(b"authorization", token)]}
+
+    await middleware(scope("GET", "/api/projects"), None, None)
+    assert db.state_counters.docs == []
+
+    await middleware(scope("POST", "/api/chat"), None, None)
+    assert sorted(d["_id"].split(":")[2] for d in db.state_counters.docs) == ["ip", "user"]
+
+
+def test_worker_count(monkeypatch):
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    assert worker_count() == 1
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    assert worker_count() == 4
+    monkeypatch.delenv("WEB_CONCURRENCY")
+    monkeypatch.setattr(shared_state.multiprocessing, "parent_process", lambda: object())
+    assert worker_count() is None
+
+
+def test_unset_proxy_hops_is_reported_once(monkeypatch, caplog):
+    monkeypatch.setattr(ratelimit, "PROXY_HOPS", None)
+    monkeypatch.setattr(ratelimit, "_proxy_hops_reported", False)
+    scope = {"client": ("10.0.0.1", 5000)}
+    with caplog.at_level(logging.ERROR):
+        assert client_ip(scope, b"203.0.113.1") == "10.0.0.1"
+        assert client_ip(scope, b"203.0.113.2") == "10.0.0.1"
+    assert len([r for r in caplog.records if "RATE_LIMIT_PROXY_HOPS" in r.message]) == 1
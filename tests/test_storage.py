@@ -0,0 +1,123 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+from bson.binary import Binary
+
+import migrate_messages
+from storage import created_us, decode_message, encode_message
+
+LUAU = """local Players = game:GetService("Players")
+local ReplicatedStorage = game:GetService("ReplicatedStorage")
+""" + "print(Players.LocalPlayer.Name)\n" * 200
+
+
+def message(content="make a sword", at=None, project_id="p1"):
+    at = at or datetime(2025, 1, 1, 12, 0, 0, 123000, tzinfo=timezone.utc)
+    return {
+        "id": str(uuid.uuid4()),
+        "project_id": project_id,
+        "role": "assistant",
+        "content": content,
+        "created_at": at.isoformat(),
+    }
+
+
+def test_legacy_round_trip():
+    doc = message()
+    stored = encode_message(doc, "legacy")
+    assert stored == dict(doc, created_us=created_us(doc["created_at"]))
+    assert decode_message(stored) == doc
+
+
+@pytest.mark.parametrize("codec", ["zlib", "zstd"])
+def test_compact_round_trip(codec):
+    if codec == "zstd":
+        pytest.importorskip("zstandard")
+    doc = message(LUAU)
+    stored = encode_message(doc, "compact", codec=codec, threshold=64)
+
+    assert isinstance(stored["id"], Binary)
+    assert isinstance(stored["created_at"], datetime)
+    assert "content" not in stored
+    assert stored["codec"] == codec
+    assert len(stored["content_z"]) < len(LUAU)
+    assert decode_message(stored) == doc
+
+
+def test_compressed_body_stays_searchable():
+    stored = encode_message(message(LUAU), "compact", codec="zlib", threshold=64)
+    terms = stored["search_text"].split()
+    assert {"getservice", "replicatedstorage", "localplayer"} <= set(terms)
+    assert len(terms) == len(set(terms))
+    assert len(stored["search_text"]) < len(LUAU) // 10
+
+
+def test_short_body_is_not_compressed():
+    doc = message()
+    stored = encode_message(doc, "compact", codec="zlib")
+    assert stored["content"] == doc["content"]
+    assert "content_z" not in stored and "search_text" not in stored
+    assert decode_message(stored) == doc
+
+
+class SyncCollection:
+    """Blocking view of a fake collection, driven from a worker thread like pymongo."""
+
+    def __init__(self, collection, loop):
+        self.collection = collection
+        self.loop = loop
+
+    def find(self, query):
+        cursor = self.collection.find(query)
+        return SyncCursor(cursor._results())
+
+    def bulk_write(self, requests, ordered=True):
+        return asyncio.run_coroutine_threadsafe(self.collection.bulk_write(requests, ordered), self.loop).result()
+
+
+class SyncCursor(list):
+    def batch_size(self, n):
+        return self
+
+
+async def test_mixed_formats_keep_chronological_order(client, auth, project, fake_db):
+    # Older messages already compact, newer ones still legacy: the state after
+    # switching MESSAGE_STORAGE_FORMAT back, or partway through a migration
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    docs = [message(f"turn {i}", start + timedelta(minutes=i), project["id"]) for i in range(6)]
+    for i, doc in enumerate(docs):
+        await fake_db.messages.insert_one(encode_message(doc, "compact" if i < 3 else "legacy", codec="zlib"))
+
+    async def contents():
+        response = await client.get(f"/api/messages/{project['id']}", headers=auth)
+        return [m["content"] for m in response.json()]
+
+    expected = [doc["content"] for doc in docs]
+    assert await contents() == expected
+
+    sync_db = type("SyncDatabase", (), {"messages": SyncCollection(fake_db.messages, asyncio.get_running_loop())})
+    for target in ("compact", "legacy"):
+        await asyncio.to_thread(migrate_messages.migrate, sync_db, target, 2, False)
+        assert len(fake_db.messages.docs) == 6
+        assert await contents() == expected
+    assert all(isinstance(d["created_at"], str) for d in fake_db.messages.docs)
+
+
+async def test_order_follows_created_at_not_object_id(client, auth, project, fake_db):
+    # Two workers writing in the same second: ObjectIds only order by whole
+    # seconds and then by each process's random value
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    docs = [message(f"turn {i}", start + timedelta(milliseconds=i), project["id"]) for i in range(4)]
+    ids = sorted(ObjectId() for _ in docs)
+    for i, doc in enumerate(docs):
+        stored = encode_message(doc, "compact" if i % 2 else "legacy", codec="zlib")
+        await fake_db.messages.insert_one(dict(stored, _id=ids[-1 - i]))
+    # Written before created_us existed: the oldest, ordered by their string
+    for i in (2, 1):
+        await fake_db.messages.insert_one(message(f"old {i}", start - timedelta(minutes=i), project["id"]))
+
+    response = await client.get(f"/api/messages/{project['id']}", headers=auth)
+    assert [m["content"] for m in response.json()] == ["old 2", "old 1"] + [doc["content"] for doc in docs]
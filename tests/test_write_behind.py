@@ -0,0 +1,181 @@
+import os
+import subprocess
+import sys
+
+import pytest
+import pytest_asyncio
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+import server
+from write_behind import WriteBehindBuffer
+
+from tests.test_chat import chat
+
+
+@pytest_asyncio.fixture
+async def buffer(app, monkeypatch):
+    # No background loop: writes only land when something flushes
+    buffer = WriteBehindBuffer(lambda: server.db, enabled=True, interval=3600)
+    monkeypatch.setattr(server, "write_buffer", buffer)
+    yield buffer
+    await buffer.stop()
+
+
+async def test_chat_turns_are_queued_until_read(client, auth, project, fake_db, buffer):
+    assert (await chat(client, auth, project)).status_code == 200
+    assert fake_db.messages.docs == []
+    assert len(buffer.pending(project["id"])) == 2
+
+    messages = (await client.get(f"/api/messages/{project['id']}", headers=auth)).json()
+    assert [m["role"] for m in messages] == ["user", "assistant"]
+    assert len(fake_db.messages.docs) == 2
+    assert buffer.pending(project["id"]) == []
+
+
+async def test_history_includes_queued_turns(client, auth, project, openrouter, buffer):
+    await chat(client, auth, project, "first")
+    await chat(client, auth, project, "second")
+
+    sent = openrouter.requests[-1]["messages"]
+    assert [m["content"] for m in sent[1:]] == ["first", openrouter.reply, "second"]
+
+
+async def test_rollup_increments_are_merged_per_flush(client, auth, project, fake_db, buffer):
+    for i in range(3):
+        await chat(client, auth, project, f"msg {i}")
+    await buffer.flush()
+
+    rollups = fake_db.usage_rollups.docs
+    assert len(rollups) == 6
+    assert {doc["turns"] for doc in rollups} == {3}
+    usage = (await client.get("/api/usage", headers=auth)).json()
+    assert usage["totals"]["prompt_tokens"] == 360
+
+
+async def test_deleting_project_drops_queued_messages(client, auth, project, fake_db, buffer):
+    await chat(client, auth, project)
+    assert (await client.delete(f"/api/projects/{project['id']}", headers=auth)).status_code == 200
+    await buffer.flush()
+    assert fake_db.messages.docs == []
+
+
+async def test_failed_flush_keeps_messages_queued(client, auth, project, fake_db, buffer):
+    await chat(client, auth, project)
+
+    async def down(docs, ordered=True):
+        raise ConnectionError("fake mongo is down")
+
+    fake_db.messages.insert_many = down
+    with pytest.raises(ConnectionError):
+        await buffer.flush()
+    assert len(buffer.pending(project["id"])) == 2
+
+    del fake_db.messages.insert_many
+    await buffer.stop()
+    assert len(fake_db.messages.docs) == 2
+
+
+async def test_failed_counter_flush_keeps_increments_queued(client, auth, project, fake_db, buffer):
+    await chat(client, auth, project, "first")
+
+    async def down(requests, ordered=True):
+        raise ConnectionError("fake mongo is down")
+
+    fake_db.usage_rollups.bulk_write = down
+    with pytest.raises(ConnectionError):
+        await buffer.flush()
+    assert fake_db.usage_rollups.docs == []
+    # Counters still land even though the rollups failed
+    assert [doc["value"] for doc in fake_db.state_counters.docs] == [1]
+
+    await chat(client, auth, project, "second")
+    with pytest.raises(RuntimeError, match="6 counter updates unwritten"):
+        await buffer.stop()
+
+    del fake_db.usage_rollups.bulk_write
+    await buffer.stop()
+    assert {doc["turns"] for doc in fake_db.usage_rollups.docs} == {2}
+    assert [doc["value"] for doc in fake_db.state_counters.docs] == [2]
+
+
+async def test_partially_applied_counter_batch_is_not_double_counted(client, auth, project, fake_db, buffer):
+    await chat(client, auth, project)
+    bulk_write = fake_db.usage_rollups.bulk_write
+
+    async def first_update_fails(requests, ordered=True):
+        await bulk_write(requests[1:], ordered=ordered)
+        raise BulkWriteError({"writeErrors": [{"index": 0, "code": 11000, "errmsg": "E11000 upsert race"}]})
+
+    fake_db.usage_rollups.bulk_write = first_update_fails
+    with pytest.raises(BulkWriteError):
+        await buffer.flush()
+    assert len(fake_db.usage_rollups.docs) == 5
+
+    del fake_db.usage_rollups.bulk_write
+    await buffer.flush()
+    assert len(fake_db.usage_rollups.docs) == 6
+    assert {doc["turns"] for doc in fake_db.usage_rollups.docs} == {1}
+
+
+async def test_batch_resent_after_partial_failure_lands_once(client, auth, project, fake_db, buffer):
+    await chat(client, auth, project, "first")
+    await chat(client, auth, project, "second")
+    insert_many = fake_db.messages.insert_many
+
+    async def drops_halfway(docs, ordered=True):
+        await insert_many(docs[:len(docs) // 2], ordered=ordered)
+        raise AutoReconnect("connection reset")
+
+    fake_db.messages.insert_many = drops_halfway
+    with pytest.raises(AutoReconnect):
+        await buffer.flush()
+    assert len(fake_db.messages.docs) == 2
+    assert len(buffer.pending(project["id"])) == 4
+
+    del fake_db.messages.insert_many
+    await buffer.flush()
+    assert len(fake_db.messages.docs) == 4
+    assert len({doc["_id"] for doc in fake_db.messages.docs}) == 4
+    assert buffer.pending(project["id"]) == []
+    assert not buffer.dead_letters
+
+
+async def test_rejected_message_is_dead_lettered(client, auth, project, fake_db, buffer):
+    await chat(client, auth, project)
+    rejected = buffer.pending(project["id"])[0]
+    fake_db.messages.unique.append(["id"])
+    fake_db.messages.docs.append({"_id": "clash", "id": rejected["id"], "project_id": "elsewhere"})
+
+    await buffer.flush()
+    assert [d["message"]["id"] for d in buffer.dead_letters] == [rejected["id"]]
+    assert buffer.pending(project["id"]) == []
+    messages = (await client.get(f"/api/messages/{project['id']}", headers=auth)).json()
+    assert [m["role"] for m in messages] == ["assistant"]
+
+
+async def test_quota_counter_is_batched(client, auth, project, fake_db, buffer):
+    for i in range(2):
+        await chat(client, auth, project, f"msg {i}")
+    assert fake_db.state_counters.docs == []
+
+    await buffer.flush()
+    [counter] = fake_db.state_counters.docs
+    assert counter["value"] == 2
+
+    # A restarted worker picks up where the persisted count left off
+    restarted = WriteBehindBuffer(lambda: server.db, enabled=True)
+    assert await restarted.incr(counter["_id"], 1, counter["expires_at"]) == 3
+
+
+@pytest.mark.parametrize("web_concurrency, refused", [(None, True), ("1", False), ("4", True)])
+def test_write_behind_refuses_unconfirmed_worker_count(web_concurrency, refused):
+    # As under `uvicorn --workers N`, which spawns workers without setting WEB_CONCURRENCY
+    code = "import multiprocessing; multiprocessing.parent_process = lambda: object(); import server"
+    env = dict(os.environ, WRITE_BEHIND="1", SHARED_STATE_BACKEND="memory")
+    env.pop("WEB_CONCURRENCY", None)
+    if web_concurrency:
+        env["WEB_CONCURRENCY"] = web_concurrency
+    result = subprocess.run([sys.executable, "-c", code], cwd=server.ROOT_DIR, env=env,
+                            capture_output=True, text=True)
+    assert ("WRITE_BEHIND=1 requires" in result.stderr) == refused
+    assert (result.returncode != 0) == refused